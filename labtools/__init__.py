@@ -31,6 +31,13 @@ from labtools._src.util import topylist
 from labtools._src.util import compute_obj_hash
 from labtools._src.util import CustomJSONEncoder
 from labtools._src.util import BestEffortJSONEncoder
+from labtools._src.util import JSONBackend
+from labtools._src.util import get_json_backend
+from labtools._src.util import json_dumps
+from labtools._src.util import json_loads
+from labtools._src.util import register_json_backend
+from labtools._src.util import register_json_type
+from labtools._src.util import set_json_backend
 from labtools._src.util import ensure_listlike
 from labtools._src.util import safe_zip
 from labtools._src.util import safe_map
@@ -43,12 +50,40 @@ from labtools._src.util import cleanup_cache_files
 from labtools._src.util import tolist
 
 from labtools._src.io_util import dump_json
+from labtools._src.io_util import load_json
+from labtools._src.io_util import dump_json_async
+from labtools._src.io_util import dump_jsonl_async
+from labtools._src.io_util import AsyncWriter
+from labtools._src.io_util import default_async_writer
 from labtools._src.io_util import dump_jsonl
+from labtools._src.io_util import dump_jsonl_sharded
+from labtools._src.io_util import JsonlWriter
 from labtools._src.io_util import load_jsonl
+from labtools._src.io_util import load_jsonl_sharded
+from labtools._src.io_util import load_jsonl_shuffled
+from labtools._src.io_util import list_jsonl_shards
+from labtools._src.io_util import load_jsonl_columns
+from labtools._src.io_util import load_jsonl_arrow
+from labtools._src.io_util import load_jsonl_df
+from labtools._src.io_util import JsonlFile
+from labtools._src.io_util import LazyRecord
+from labtools._src.io_util import SharedJsonlDataset
 from labtools._src.io_util import load_and_check_yml
+from labtools._src.io_util import load_and_check_ymls
+from labtools._src.io_util import enable_load_cache
+from labtools._src.io_util import disable_load_cache
+from labtools._src.io_util import load_cache_info
+from labtools._src.io_util import LoadCacheInfo
+from labtools._src.io_util import FrozenDict
+from labtools._src.io_util import FrozenList
 from labtools._src.io_util import maybe_rlocation
 from labtools._src.io_util import download_files
 
+from labtools._src.tfrecord import dump_tfrecord
+from labtools._src.tfrecord import load_tfrecord
+from labtools._src.tfrecord import TFRecordFile
+from labtools._src.tfrecord import TFRecordWriter
+
 from labtools._src.config import setup_jupyter_env
 from labtools._src.config import frozen
 from labtools._src.config import configure_logging
@@ -76,6 +111,13 @@ __all__ = (
     'compute_obj_hash',
     'CustomJSONEncoder',
     'BestEffortJSONEncoder',
+    'JSONBackend',
+    'get_json_backend',
+    'json_dumps',
+    'json_loads',
+    'register_json_backend',
+    'register_json_type',
+    'set_json_backend',
     'ensure_listlike',
     'safe_zip',
     'safe_map',
@@ -85,10 +127,37 @@ __all__ = (
     'split_by_keys',
     'get_differences',
     'dump_json',
+    'load_json',
+    'dump_json_async',
+    'dump_jsonl_async',
+    'AsyncWriter',
+    'default_async_writer',
     'dump_jsonl',
+    'dump_jsonl_sharded',
+    'JsonlWriter',
     'load_jsonl',
+    'load_jsonl_sharded',
+    'load_jsonl_shuffled',
+    'list_jsonl_shards',
+    'load_jsonl_columns',
+    'load_jsonl_arrow',
+    'load_jsonl_df',
+    'JsonlFile',
+    'LazyRecord',
+    'SharedJsonlDataset',
     'download_files',
+    'dump_tfrecord',
+    'load_tfrecord',
+    'TFRecordFile',
+    'TFRecordWriter',
     'load_and_check_yml',
+    'load_and_check_ymls',
+    'enable_load_cache',
+    'disable_load_cache',
+    'load_cache_info',
+    'LoadCacheInfo',
+    'FrozenDict',
+    'FrozenList',
     'setup_jupyter_env',
     'configure_logging',
     'maybe_rlocation',
@@ -0,0 +1,89 @@
+# Copyright 2021 Cory Paik. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+""" Benchmarks `download_files` against a local HTTP server.
+
+Example:
+  $ bazel run //labtools/_src:download_benchmark -- --num_files=2000
+"""
+from multiprocessing.pool import ThreadPool
+import os
+from pathlib import Path
+import tempfile
+import time
+
+from absl import app
+from absl import flags
+import requests
+
+from labtools._src.io_util import download_files
+from labtools._src.testing._http_server import LocalHTTPServer
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('num_files', 1000, 'Number of files to download.')
+flags.DEFINE_integer('file_size', 16 * 2**10, 'Size of each file in bytes.')
+flags.DEFINE_integer('num_threads', 8, 'Number of downloader threads.')
+flags.DEFINE_integer('chunk_size', 2**16, 'Chunk size for `download_files`.')
+flags.DEFINE_integer('max_concurrency', 64,
+                     'Concurrent downloads for the asyncio backend.')
+flags.DEFINE_float('delay', 0.0, 'Simulated server latency in seconds.')
+
+
+def _download_file_unpooled(task):
+  """ A new connection per file, reading 128 byte chunks (the old behavior). """
+  url, fpath = task
+  r = requests.get(url, stream=True)
+  with open(fpath, 'wb') as f:
+    for data in r:
+      f.write(data)
+  return 1
+
+
+def main(_):
+  files = {
+      f'/{i}.bin': os.urandom(FLAGS.file_size) for i in range(FLAGS.num_files)
+  }
+  print(f'{"method":<12} {"files/s":>10} {"MB/s":>8} {"connections":>12}')
+  with tempfile.TemporaryDirectory() as td:
+    for method in ['unpooled', 'pooled', 'asyncio']:
+      download_dir = Path(td, method)
+      download_dir.mkdir()
+      with LocalHTTPServer(files, delay=FLAGS.delay) as server:
+        tasks = [{'filename': name[1:], 'url': server.url(name)}
+                 for name in files]
+        tick = time.perf_counter()
+        if method == 'pooled':
+          download_files(tasks,
+                         download_dir,
+                         num_threads=FLAGS.num_threads,
+                         chunk_size=FLAGS.chunk_size)
+        elif method == 'asyncio':
+          download_files(tasks,
+                         download_dir,
+                         chunk_size=FLAGS.chunk_size,
+                         backend='asyncio',
+                         max_concurrency=FLAGS.max_concurrency)
+        else:
+          with ThreadPool(FLAGS.num_threads) as p:
+            p.map(_download_file_unpooled,
+                  [(t['url'], download_dir / t['filename']) for t in tasks])
+        elapsed = time.perf_counter() - tick
+        num_connections = server.num_connections
+      num_bytes = FLAGS.num_files * FLAGS.file_size / 2**20
+      print(f'{method:<12} {FLAGS.num_files / elapsed:>10.0f} '
+            f'{num_bytes / elapsed:>8.1f} {num_connections:>12}')
+
+
+if __name__ == '__main__':
+  app.run(main)
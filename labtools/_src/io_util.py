@@ -16,29 +16,443 @@
 
 from __future__ import annotations
 
-import json
+from array import array
+import asyncio
+import atexit
+from collections import OrderedDict
+from collections import deque
+from collections.abc import Mapping
+from collections.abc import Sequence
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from functools import partial
+import gzip
+import hashlib
+import io
+import itertools
+import mmap
 import multiprocessing as mp
+from multiprocessing import shared_memory
 from multiprocessing.pool import ThreadPool
 import os
 from pathlib import Path
+import queue
+import random
 import re
-from typing import Any, Dict, Generator, List, Optional, Tuple, Union
+import threading
+import time
+import urllib.parse
+from typing import (Any, Callable, Coroutine, Dict, Generator, Hashable,
+                    Iterable, Iterator, List, NamedTuple, Optional, Tuple,
+                    Union)
 
 from absl import logging
 import requests
 import tlz.curried as T
 
+from labtools._src.profiling import profiler
 from labtools._src.util import BestEffortJSONEncoder
 from labtools._src.util import CustomJSONEncoder
+from labtools._src.util import compute_obj_hash
+from labtools._src.util import get_json_backend
+from labtools._src.util import json_dumps
+from labtools._src.util import json_loads
 from labtools._src.util import maybe_import
 from labtools._src.util import require
 
 # try imports
+aiohttp = maybe_import('aiohttp')
+lz4_frame = maybe_import('lz4.frame')
+np = maybe_import('numpy')
+pa = maybe_import('pyarrow')
+pd = maybe_import('pandas')
 yaml = maybe_import('yaml')
+zstandard = maybe_import('zstandard')
+
+# compression codecs, see `_open`.
+_COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+    '.lz4': 'lz4',
+}
+_COMPRESSION_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+    b'\x04\x22\x4d\x18': 'lz4',
+}
+_COMPRESSION_MODULES = {'zstd': 'zstandard', 'lz4': 'lz4.frame'}
+
+
+class _BackgroundWriter(io.RawIOBase):
+  """ Forwards writes to a (compressed) file object on a background thread.
+
+  This lets encoding on the calling thread overlap with compression, which
+  releases the GIL for gzip and lz4.
+  """
+
+  def __init__(self, fileobj, max_queue_size: int = 16):
+    super().__init__()
+    self._fileobj = fileobj
+    self._queue = queue.Queue(max_queue_size)
+    self._error = None
+    self._thread = threading.Thread(target=self._worker, daemon=True)
+    self._thread.start()
+
+  def _worker(self):
+    while True:
+      data = self._queue.get()
+      try:
+        if data is None:
+          return
+        if self._error is None:
+          self._fileobj.write(data)
+      except BaseException as e:  # pylint: disable=broad-except
+        self._error = e
+      finally:
+        self._queue.task_done()
+
+  def _check_error(self):
+    if self._error is not None:
+      raise self._error
+
+  def writable(self) -> bool:
+    return True
+
+  def write(self, b) -> int:
+    self._check_error()
+    # `b` is only valid during the call, so we must copy it.
+    self._queue.put(bytes(b))
+    return len(b)
+
+  def flush(self):
+    if not self.closed:
+      self._queue.join()
+      self._check_error()
+      self._fileobj.flush()
+
+  def fileno(self) -> int:
+    return self._fileobj.fileno()
+
+  def close(self):
+    if not self.closed:
+      try:
+        # flushes all pending writes.
+        super().close()
+      finally:
+        self._queue.put(None)
+        self._thread.join()
+        self._fileobj.close()
+      self._check_error()
+
+
+def _infer_compression(path: Union[Path, str],
+                       compression: Optional[str],
+                       mode: str = 'r') -> Optional[str]:
+  """ Resolves the compression codec for `path`.
+
+  When `compression='infer'`, the codec is detected from the magic bytes of
+  existing files (for reading) or from the suffix of the path (for writing).
+  """
+  if compression != 'infer':
+    return compression
+  if mode.startswith('r'):
+    with open(path, 'rb') as f:
+      head = f.read(4)
+    for magic, codec in _COMPRESSION_MAGIC.items():
+      if head.startswith(magic):
+        return codec
+    return None
+  return _COMPRESSION_SUFFIXES.get(Path(path).suffix)
+
+
+def _open(path: Union[Path, str],
+          mode: str = 'r',
+          compression: Optional[str] = 'infer',
+          threads: int = -1):
+  """ Opens a file, transparently (de)compressing it.
+
+  Args:
+    path: Path to the file.
+    mode: One of 'r', 'w', 'rb' or 'wb'. Text modes use utf-8.
+    compression: One of 'gzip', 'zstd', 'lz4', None (no compression) or
+      'infer'. If `zstandard` or `lz4` are not installed, writes fall back to
+      gzip (reads detect the actual codec from the file). See
+      `_infer_compression`.
+    threads: Number of compression threads for zstd, where -1 uses all cores.
+      Writes with other codecs compress on a single background thread.
+  """
+  codec = _infer_compression(path, compression, mode)
+  reading = mode.startswith('r')
+  module = _COMPRESSION_MODULES.get(codec)
+  if module is not None and maybe_import(module) is None:
+    if reading:
+      raise ImportError(
+          f'Reading {path} requires {module}, but it is not installed.')
+    logging.warning('%s is not installed, falling back to gzip for %s.',
+                    module, path)
+    codec = 'gzip'
+
+  if codec is None:
+    f = open(path, mode[0] + 'b')
+  elif codec == 'gzip':
+    f = gzip.open(path, mode[0] + 'b')
+  elif codec == 'zstd':
+    if reading:
+      f = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'),
+                                                      closefd=True)
+      f = io.BufferedReader(f)
+    else:
+      cctx = zstandard.ZstdCompressor(threads=threads)
+      f = cctx.stream_writer(open(path, 'wb'), closefd=True)
+  elif codec == 'lz4':
+    f = lz4_frame.open(path, mode[0] + 'b')
+  else:
+    raise ValueError(f'Unknown compression {codec}.')
+
+  if codec in ('gzip', 'lz4') and not reading:
+    f = _BackgroundWriter(f)
+    if not mode.endswith('b'):
+      f = io.BufferedWriter(f, buffer_size=2**20)
+  if not mode.endswith('b'):
+    f = io.TextIOWrapper(f, encoding='utf-8')
+  return f
+
+
+def _check_uncompressed(path: Union[Path, str], feature: str) -> None:
+  codec = _infer_compression(path, 'infer')
+  if codec is not None:
+    raise ValueError(f'{feature} is not supported for {codec} compressed '
+                     f'files ({path}).')
+
+
+def _immutable(*args, **kwargs):
+  raise TypeError('Cached objects are read-only. Use `copy.deepcopy` to get a '
+                  'mutable copy.')
+
+
+class FrozenDict(dict):
+  """ A read-only dict returned by loaders when the load cache is enabled.
+
+  Copies (`copy.copy`, `copy.deepcopy` and pickling) are plain, mutable dicts.
+  """
+  __slots__ = ()
+  __setitem__ = __delitem__ = __ior__ = _immutable
+  clear = pop = popitem = setdefault = update = _immutable
+
+  def __copy__(self):
+    return dict(self)
+
+  def __deepcopy__(self, memo):
+    return _thaw(self)
+
+  def __reduce__(self):
+    return (_thaw, (dict(self),))
+
+
+class FrozenList(list):
+  """ A read-only list returned by loaders when the load cache is enabled.
+
+  Copies (`copy.copy`, `copy.deepcopy` and pickling) are plain, mutable lists.
+  """
+  __slots__ = ()
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+  append = clear = extend = insert = pop = remove = reverse = sort = _immutable
+
+  def __copy__(self):
+    return list(self)
+
+  def __deepcopy__(self, memo):
+    return _thaw(self)
+
+  def __reduce__(self):
+    return (_thaw, (list(self),))
+
+
+def _freeze(obj: Any) -> Any:
+  """ Recursively converts containers to their read-only counterparts. """
+  if isinstance(obj, dict):
+    return FrozenDict((k, _freeze(v)) for k, v in obj.items())
+  if isinstance(obj, list):
+    return FrozenList(map(_freeze, obj))
+  if np is not None and isinstance(obj, np.ndarray) and obj.flags.writeable:
+    obj = obj.view()
+    obj.flags.writeable = False
+  return obj
+
+
+def _thaw(obj: Any) -> Any:
+  """ Recursively converts read-only containers to mutable copies. """
+  if isinstance(obj, dict):
+    return {k: _thaw(v) for k, v in obj.items()}
+  if isinstance(obj, list):
+    return list(map(_thaw, obj))
+  if np is not None and isinstance(obj, np.ndarray):
+    return obj.copy()
+  return obj
+
+
+class LoadCacheInfo(NamedTuple):
+  """ Statistics of the load cache (see `load_cache_info`). """
+  hits: int
+  misses: int
+  evictions: int
+  entries: int
+  size_bytes: int
+  max_bytes: int
+
+
+class _LoadCache:
+  """ A byte-budgeted LRU cache of loaded files.
+
+  Entries are keyed by the absolute path and the options of the loader, and are
+  only valid as long as the size and mtime of the file are unchanged. The size
+  of an entry is the size of the file on disk, which is cheap to compute but
+  underestimates the size of the decoded objects.
+  """
+
+  def __init__(self):
+    self.max_bytes = 0
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+    self.size_bytes = 0
+    self.hits = self.misses = self.evictions = 0
+
+  @property
+  def enabled(self) -> bool:
+    return self.max_bytes > 0
+
+  def _pop(self, key: Hashable) -> None:
+    _, _, size = self.entries.pop(key)
+    self.size_bytes -= size
+
+  def peek(self, path: Union[Path, str],
+           options: Hashable) -> Tuple[bool, Any]:
+    """ Returns whether `path` is cached, and the cached object if it is.
+
+    Only hits are counted, so that a miss can be followed by `get`.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), options)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size):
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return True, entry[1]
+    return False, None
+
+  def get(self, path: Union[Path, str], options: Hashable,
+          load_fn: Callable[[], Any]) -> Any:
+    """ Returns the cached object for `path`, loading it with `load_fn`. """
+    st = os.stat(path)
+    key = (os.path.abspath(path), options)
+    version = (st.st_mtime_ns, st.st_size)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[0] == version:
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+      self.misses += 1
+      if entry is not None:
+        self._pop(key)
+
+    obj = _freeze(load_fn())
+    with self.lock:
+      if key in self.entries:
+        self._pop(key)
+      if st.st_size <= self.max_bytes:
+        self.entries[key] = (version, obj, st.st_size)
+        self.size_bytes += st.st_size
+      while self.size_bytes > self.max_bytes:
+        self._pop(next(iter(self.entries)))
+        self.evictions += 1
+    return obj
+
+  def resize(self, max_bytes: int) -> None:
+    with self.lock:
+      self.max_bytes = max_bytes
+      while self.size_bytes > self.max_bytes:
+        self._pop(next(iter(self.entries)))
+        self.evictions += 1
+
+  def clear(self) -> None:
+    with self.lock:
+      self.entries.clear()
+      self.size_bytes = 0
+      self.hits = self.misses = self.evictions = 0
+
+  def info(self) -> LoadCacheInfo:
+    with self.lock:
+      return LoadCacheInfo(self.hits, self.misses, self.evictions,
+                           len(self.entries), self.size_bytes, self.max_bytes)
+
+
+_load_cache = _LoadCache()
+
+
+def enable_load_cache(max_bytes: int = 2**28) -> None:
+  """ Enables the in-process cache of `load_json`, `load_jsonl` and yml loaders.
+
+  While enabled, loading an unchanged file returns the previously loaded
+  object, which is shared between callers and therefore read-only: dicts and
+  lists are returned as `FrozenDict`s and `FrozenList`s, and numpy arrays are
+  read-only views. Use `copy.deepcopy` to get a mutable copy. A file is
+  reloaded whenever its size or mtime change.
+
+  Args:
+    max_bytes: Budget of the cache, in bytes of the cached files on disk. The
+      least recently used files are evicted when it is exceeded.
+
+  Example:
+    >>> enable_load_cache(2**30)
+    >>> for request in requests:
+    ...   labels = load_json('labels.json')  # only read once.
+  """
+  if max_bytes <= 0:
+    raise ValueError(f'max_bytes must be positive, got {max_bytes}.')
+  _load_cache.resize(max_bytes)
+
+
+def disable_load_cache() -> None:
+  """ Disables and clears the load cache. """
+  _load_cache.resize(0)
+  _load_cache.clear()
+
+
+def load_cache_info() -> LoadCacheInfo:
+  """ Returns hit, miss and eviction counts and the size of the load cache. """
+  return _load_cache.info()
+
+
+if yaml is not None:
+  # libyaml's loader is an order of magnitude faster, when available.
+  _YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _load_yml(path: Union[str, Path]) -> Any:
+  with open(path, 'rb') as f:
+    return yaml.load(f, Loader=_YAML_LOADER)
+
+
+def _extract_yml_keys(loaded: Any, keys: List[List[str]]) -> List[Any]:
+  return [T.get_in(key, loaded) for key in keys]
+
+
+def _load_and_extract_yml(
+    task: Tuple[str, Optional[List[List[str]]]]) -> Any:
+  """ Loads a yml file, returning only the requested keys if `keys` is set. """
+  path, keys = task
+  loaded = _load_yml(path)
+  return loaded if keys is None else _extract_yml_keys(loaded, keys)
 
 
 @require('yaml')
-def load_and_check_yml(path: Union[str, Path], *loadkeys: list[str]):
+def load_and_check_yml(path: Union[str, Path],
+                       *loadkeys: list[str],
+                       cache: bool = True):
   """ Loads and extract the specified key(s) from a yml file
 
     Args:
@@ -46,57 +460,1200 @@ def load_and_check_yml(path: Union[str, Path], *loadkeys: list[str]):
       *loadkeys: Keys to load from the config file. These can either be shallow
         keys or deep addresses seperated as '/'. In the latter case, the file
         will be flattened to find the objects recursively.
+      cache: Predicate indicating whether to use the load cache, if it is
+        enabled (see `enable_load_cache`).
 
     Returns:
       A list of Objects cooresponding to each key in loadkeys. Note that keys
       not present will have a value of None
   """
-  with open(path, 'r', encoding='utf-8') as f:
-    loaded = yaml.safe_load(f)
+  return load_and_check_ymls([path], *loadkeys, cache=cache)[0]
+
+
+@require('yaml')
+def load_and_check_ymls(paths: Iterable[Union[str, Path]],
+                        *loadkeys: list[str],
+                        num_workers: Optional[int] = None,
+                        cache: bool = True) -> List[List[Any]]:
+  """ Loads and extracts the specified key(s) from many yml files.
+
+  The keys are split once for all files. With `num_workers`, files are parsed
+  in a process pool and only the extracted values are sent back, unless the
+  load cache is enabled, in which case cached files are not parsed again and
+  the remaining files are parsed in the pool and added to the cache.
+
+  Args:
+    paths: Paths to the yml files.
+    *loadkeys: Keys to load from each file (see `load_and_check_yml`).
+    num_workers: Number of processes to parse files with. Defaults to parsing
+      serially on the calling thread.
+    cache: Predicate indicating whether to use the load cache, if it is
+      enabled (see `enable_load_cache`).
+
+  Returns:
+    A list with the values of `loadkeys` for each file in `paths`.
+
+  Example:
+    >>> load_and_check_ymls(glob.glob('sweep/*.yml'), 'model/name', 'seed',
+    ...                     num_workers=8)
+  """
+  paths = list(map(str, paths))
+  keys = [key.split('/') for key in loadkeys]
+  cache = cache and _load_cache.enabled
+  results = [None] * len(paths)
+  missing = []
+  for i, path in enumerate(paths):
+    found, loaded = _load_cache.peek(path, 'yml') if cache else (False, None)
+    if found:
+      results[i] = _extract_yml_keys(loaded, keys)
+    else:
+      missing.append(i)
+
+  # With the cache enabled, workers send back whole files to be cached.
+  tasks = [(paths[i], None if cache else keys) for i in missing]
+  if num_workers is not None and num_workers > 1 and len(tasks) > 1:
+    with mp.Pool(min(num_workers, len(tasks))) as p:
+      loaded = p.map(_load_and_extract_yml, tasks)
+      p.close()
+      p.join()
+  else:
+    loaded = map(_load_and_extract_yml, tasks)
+
+  for i, obj in zip(missing, loaded):
+    if cache:
+      obj = _load_cache.get(paths[i], 'yml', lambda obj=obj: obj)
+      obj = _extract_yml_keys(obj, keys)
+    results[i] = obj
+  return results
+
+
+def _array_sidecar_path(path: Union[Path, str]) -> Path:
+  return Path(str(path) + '.arrays')
+
+
+class _ArraySidecarWriter:
+  """ Writes large arrays out-of-line to a single binary sidecar file.
+
+  Arrays are appended to `<path>.arrays` as raw (64-byte aligned) buffers and
+  replaced by a reference object of the form
+    `{"__ndarray__": {"file": ..., "offset": ..., "dtype": ..., "shape": ...}}`
+  which `_ArraySidecarReader` resolves.
+  """
+  alignment = 64
+
+  def __init__(self, path: Union[Path, str], threshold: int):
+    if np is None:
+      raise ImportError(
+          'Array sidecars require numpy, but it is not installed.')
+    self.path = _array_sidecar_path(path)
+    self.path.unlink(missing_ok=True)
+    self.threshold = threshold
+    self._file = None
+    self._offset = 0
+
+  def _as_numpy(self, obj):
+    if isinstance(obj, np.ndarray):
+      return obj
+    if str(type(obj)) == "<class 'torch.Tensor'>":
+      try:
+        return obj.detach().cpu().numpy()
+      except TypeError:  # e.g. bfloat16
+        return None
+    return None
+
+  def _write(self, arr) -> Dict[str, Any]:
+    if self._file is None:
+      self._file = open(self.path, 'wb')
+    arr = np.ascontiguousarray(arr)
+    offset = -self._offset % self.alignment
+    self._file.write(b'\0' * offset)
+    self._offset += offset
+    ref = {
+        'file': self.path.name,
+        'offset': self._offset,
+        'dtype': arr.dtype.str,
+        'shape': list(arr.shape),
+    }
+    # zero-copy write of the underlying buffer. Viewing as bytes also supports
+    # dtypes which can't export a buffer, e.g. datetime64.
+    self._file.write(arr.reshape(-1).view(np.uint8))
+    self._offset += arr.nbytes
+    return {'__ndarray__': ref}
+
+  def externalize(self, obj):
+    """ Replaces arrays of at least `threshold` bytes by references. """
+    if isinstance(obj, dict):
+      return {k: self.externalize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+      return [self.externalize(v) for v in obj]
+    arr = self._as_numpy(obj)
+    if (arr is not None and arr.dtype != object and
+        arr.nbytes >= self.threshold):
+      return self._write(arr)
+    return obj
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+
+class _ArraySidecarReader:
+  """ Restores arrays written by `_ArraySidecarWriter`. """
+
+  def __init__(self, path: Union[Path, str], memory_map: bool = False):
+    self.dirname = Path(path).parent
+    self.memory_map = memory_map
+    self._buffers = {}
+
+  def _read(self, ref: Dict[str, Any]):
+    dtype = np.dtype(ref['dtype'])
+    count = int(np.prod(ref['shape'], dtype=np.int64))
+    fpath = self.dirname / ref['file']
+    if self.memory_map:
+      if fpath not in self._buffers:
+        self._buffers[fpath] = np.memmap(fpath, dtype=np.uint8, mode='r')
+      buf = self._buffers[fpath]
+      arr = buf[ref['offset']:ref['offset'] + count * dtype.itemsize]
+      arr = arr.view(dtype)
+    else:
+      with open(fpath, 'rb') as f:
+        f.seek(ref['offset'])
+        arr = np.fromfile(f, dtype=dtype, count=count)
+    return arr.reshape(ref['shape'])
+
+  def restore(self, obj):
+    """ Replaces array references in `obj` by the arrays they refer to. """
+    if isinstance(obj, dict):
+      if len(obj) == 1 and '__ndarray__' in obj:
+        return self._read(obj['__ndarray__'])
+      return {k: self.restore(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+      return [self.restore(v) for v in obj]
+    return obj
+
+
+def _encode_jsonl_chunk(
+    task: Tuple[List[Any], bool, str, bool]) -> Tuple[str, Optional[array]]:
+  """ Encode a chunk of records as jsonl.
+
+  Args:
+    task: A tuple containing `(records, relaxed, backend, lengths)`.
+
+  Returns:
+    A tuple containing the encoded records and, if `lengths` is true, an array
+    with the length of each line in bytes.
+  """
+  records, relaxed, backend, lengths = task
+  encoder_cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
+  lines = [json_dumps(obj, cls=encoder_cls, backend=backend) + '\n'
+           for obj in records]
+  if lengths:
+    return ''.join(lines), array('Q', (len(l.encode('utf-8')) for l in lines))
+  return ''.join(lines), None
+
+
+def _encode_jsonl_parallel(
+    data: Iterable[Any], relaxed: bool, num_workers: int, chunk_size: int,
+    lengths: bool) -> Generator[Tuple[str, Optional[array]], None, None]:
+  """ Encodes chunks of records in a process pool, yielding them in order. """
+  # The backend is resolved here so that workers match the serial output.
+  backend = get_json_backend()
+  with mp.Pool(num_workers) as p:
+    # bound the number of chunks in flight.
+    pending = deque()
+    for chunk in T.partition_all(chunk_size, data):
+      pending.append(
+          p.apply_async(_encode_jsonl_chunk,
+                        ((list(chunk), relaxed, backend, lengths),)))
+      if len(pending) >= 2 * num_workers:
+        yield pending.popleft().get()
+    while pending:
+      yield pending.popleft().get()
+    p.close()
+    p.join()
+
+
+def dump_jsonl(path: Union[Path, str],
+               data: list[dict[str, Any]],
+               relaxed: bool = True,
+               write_index: bool = False,
+               compression: Optional[str] = 'infer',
+               arrays_threshold: Optional[int] = None,
+               num_workers: Optional[int] = None,
+               chunk_size: int = 1024) -> None:
+  """ Dump to jsonl.
+  Args:
+    path: Path to the jsonl file.
+    data: object to dump.
+    relaxed: predicate indicating whether to throw an error when part of the
+      data cannot be encoded using CustomJSONEncoder.
+    write_index: predicate indicating whether to write a byte-offset index
+      alongside the file (see `JsonlFile`).
+    compression: Compression codec, inferred from the suffix of `path` by
+      default (e.g. `.gz`, `.zst` or `.lz4`). See `_open` for details.
+    arrays_threshold: If provided, arrays and tensors of at least this many
+      bytes are written out-of-line to a binary `<path>.arrays` sidecar rather
+      than expanded to lists. Use `load_jsonl(..., restore_arrays=True)` to
+      load them.
+    num_workers: Number of processes to use for encoding. If provided, `data`
+      is split into chunks of `chunk_size` records, which are encoded in a
+      process pool and written in order. The output is identical to encoding
+      serially. Note that types registered with `register_json_type` must also
+      be registered in the workers when not using the `fork` start method.
+    chunk_size: Number of records per chunk when encoding in parallel, or the
+      number of rows per block when writing a DataFrame.
+  """
+  path = Path(path)
+  path.parent.mkdir(exist_ok=True, parents=True)
+  encoder_cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
+  compression = _infer_compression(path, compression, mode='w')
+  if write_index and compression is not None:
+    raise ValueError('write_index is not supported for compressed files.')
+  # maybe it's a datframe
+  if pd is not None and isinstance(data, pd.DataFrame):
+    # write blocks of rows, so only one block is encoded in memory at once.
+    with _open(path, 'w', compression) as f:
+      for start in range(0, len(data), chunk_size):
+        block = data.iloc[start:start + chunk_size]
+        text = block.to_json(orient='records', lines=True)
+        # older versions of pandas omit the trailing newline.
+        f.write(text if text.endswith('\n') else text + '\n')
+    if write_index:
+      _write_index(path, _build_jsonl_index(path))
+    return
+
+  offsets, pos = array('Q'), 0
+  arrays = None
+  if arrays_threshold is not None:
+    arrays = _ArraySidecarWriter(path, arrays_threshold)
+    data = map(arrays.externalize, data)
+
+  try:
+    with _open(path, 'w', compression) as f:
+      if num_workers is not None and num_workers > 1:
+        for text, lengths in _encode_jsonl_parallel(data, relaxed, num_workers,
+                                                    chunk_size, write_index):
+          if write_index:
+            for length in lengths:
+              offsets.append(pos)
+              pos += length
+          f.write(text)
+      else:
+        for obj in data:
+          line = json_dumps(obj, cls=encoder_cls) + '\n'
+          if write_index:
+            offsets.append(pos)
+            pos += len(line.encode('utf-8'))
+          f.write(line)
+  finally:
+    # the sidecar is closed even if encoding fails (e.g. when not relaxed).
+    if arrays is not None:
+      arrays.close()
+  if write_index:
+    offsets.append(pos)
+    _write_index(path, offsets)
+
+
+def _index_path(path: Union[Path, str]) -> Path:
+  return Path(str(path) + '.idx')
+
+
+def _build_jsonl_index(path: Union[Path, str]) -> array:
+  """ Scans a jsonl file for the byte offsets of each record.
+
+  Returns:
+    An array of unsigned 64-bit integers containing the starting offset of each
+    non-empty line followed by the size of the file, such that record `i` spans
+    the bytes `[offsets[i], offsets[i + 1])`.
+  """
+  offsets, pos = array('Q'), 0
+  with open(path, 'rb') as f:
+    for line in f:
+      if line.strip():
+        offsets.append(pos)
+      pos += len(line)
+  offsets.append(pos)
+  return offsets
+
+
+def _write_index(path: Union[Path, str], offsets: array) -> None:
+  idx_path = _index_path(path)
+  tmp_path = idx_path.with_name(idx_path.name + '.tmp')
+  with open(tmp_path, 'wb') as f:
+    offsets.tofile(f)
+  os.replace(tmp_path, idx_path)
+
+
+def _read_index(path: Union[Path, str]) -> Optional[array]:
+  """ Reads the index sidecar for `path`, if it exists and is up to date. """
+  idx_path = _index_path(path)
+  try:
+    if os.path.getmtime(idx_path) < os.path.getmtime(path):
+      return None
+    offsets = array('Q', idx_path.read_bytes())
+  except (OSError, ValueError):
+    return None
+  # The last entry is the size of the file at the time it was indexed.
+  if len(offsets) == 0 or offsets[-1] != os.path.getsize(path):
+    return None
+  return offsets
+
+
+class JsonlFile(Sequence):
+  """ Random access to the records of a jsonl file.
+
+  Records are located using a byte-offset index, which is read from the
+  `<path>.idx` sidecar written by `dump_jsonl(..., write_index=True)`. If the
+  sidecar is missing or out of date, the index is rebuilt with a single scan of
+  the file (and optionally saved). Each lookup is then a single seek and read.
+
+  Example:
+    >>> with JsonlFile('results.jsonl') as f:
+    ...   n = len(f)
+    ...   first, last = f[0], f[-1]
+    ...   batch = f.sample(32, seed=0)
+
+  Args:
+    path: Path to the jsonl file.
+    save_index: Predicate indicating whether to write the index sidecar when it
+      has to be rebuilt. Failures to write (e.g. read-only directories) are
+      logged and ignored.
+  """
+
+  def __init__(self, path: Union[Path, str], save_index: bool = True):
+    self.path = Path(path)
+    _check_uncompressed(self.path, 'JsonlFile')
+    offsets = _read_index(self.path)
+    if offsets is None:
+      offsets = _build_jsonl_index(self.path)
+      if save_index:
+        try:
+          _write_index(self.path, offsets)
+        except OSError:
+          logging.warning('Failed to write jsonl index for %s', self.path)
+    self._offsets = offsets
+    self._file = open(self.path, 'rb')
+
+  def __len__(self) -> int:
+    return len(self._offsets) - 1
+
+  def _read(self, idx: int) -> Dict[str, Any]:
+    start, end = self._offsets[idx], self._offsets[idx + 1]
+    self._file.seek(start)
+    return json_loads(self._file.read(end - start))
+
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return [self._read(i) for i in range(*idx.indices(len(self)))]
+    n = len(self)
+    if idx < 0:
+      idx += n
+    if not 0 <= idx < n:
+      raise IndexError('JsonlFile index out of range')
+    return self._read(idx)
+
+  def __iter__(self) -> Iterator[Dict[str, Any]]:
+    for idx in range(len(self)):
+      yield self._read(idx)
+
+  def sample(self,
+             n: int,
+             seed: Optional[int] = None,
+             replace: bool = False) -> List[Dict[str, Any]]:
+    """ Randomly sample `n` records.
+
+    Args:
+      n: Number of records to sample.
+      seed: Seed for the random number generator.
+      replace: Predicate indicating whether to sample with replacement.
+    """
+    rng = random.Random(seed)
+    if replace:
+      indices = rng.choices(range(len(self)), k=n)
+    else:
+      indices = rng.sample(range(len(self)), n)
+    return [self._read(idx) for idx in indices]
+
+  def close(self):
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def _jsonl_byte_ranges(path: Union[Path, str],
+                       chunk_size: int) -> List[Tuple[int, int]]:
+  """ Splits a jsonl file into newline-aligned byte ranges.
+
+  Args:
+    path: Path to the jsonl file.
+    chunk_size: Approximate size of each range in bytes. Each range is extended
+      to the end of the line it would otherwise split.
+
+  Returns:
+    A list of `(start, end)` byte offsets covering the entire file.
+  """
+  file_size = os.path.getsize(path)
+  ranges = []
+  with open(path, 'rb') as f:
+    start = 0
+    while start < file_size:
+      end = min(start + chunk_size, file_size)
+      if end < file_size:
+        f.seek(end)
+        f.readline()
+        end = f.tell()
+      ranges.append((start, end))
+      start = end
+  return ranges
+
+
+_MISSING = object()
+# Strings containing only these characters are encoded identically by all json
+# encoders, which makes them safe to search for in raw lines.
+_PREFILTER_SAFE = re.compile(r'^[\w .:,;+=@#%&*()\[\]{}<>!?~-]*$', re.ASCII)
+
+
+def _prefilter_needle(value: Any) -> Optional[bytes]:
+  """ Returns bytes which must appear in the raw line of a matching record. """
+  if value is None or isinstance(value, bool):
+    return {None: b'null', True: b'true', False: b'false'}[value]
+  if isinstance(value, int):
+    return str(value).encode()
+  if isinstance(value, str) and _PREFILTER_SAFE.match(value):
+    return b'"' + value.encode() + b'"'
+  return None
+
+
+def _where_equal(value: Any, expected: Any) -> bool:
+  """ Compares a record value to a `where` value.
+
+  Booleans and integers only match values of the same type, as in json, e.g.
+  `1` matches neither `true` nor `1.0`. This makes the check agree with the
+  prefilter, since such values are always encoded as the same bytes.
+  """
+  if isinstance(expected, bool) or isinstance(value, bool):
+    return isinstance(expected, bool) and isinstance(value, bool) and (
+        value == expected)
+  if isinstance(expected, int):
+    return isinstance(value, int) and value == expected
+  return value == expected
+
+
+class _RecordFilter:
+  """ Filters and projects raw jsonl lines.
+
+  Lines are first checked for the encoded `where` values with a substring
+  search, so most non-matching lines are rejected without being decoded.
+  Matching lines are then decoded, checked exactly (see `_where_equal`) and
+  projected to `columns`.
+
+  Args:
+    columns: Keys to keep, or None to keep all keys.
+    where: Either a dict of `{key: value}` pairs, all of which must be equal to
+      the values of the record, or a function of the record returning whether
+      to keep it.
+  """
+
+  def __init__(
+      self,
+      columns: Optional[List[str]] = None,
+      where: Union[None, Dict[str, Any], Callable[[Any], bool]] = None):
+    self.columns = columns
+    self.where = where
+    self.needles = []
+    if isinstance(where, dict):
+      self.needles = [n for n in map(_prefilter_needle, where.values()) if n]
+
+  def prefilter(self, line: bytes) -> bool:
+    return all(needle in line for needle in self.needles)
+
+  def matches(self, obj: Mapping) -> bool:
+    if self.where is None:
+      return True
+    if callable(self.where):
+      return self.where(obj)
+    return all(
+        _where_equal(obj.get(k, _MISSING), v) for k, v in self.where.items())
+
+  def project(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+    if self.columns is None:
+      return obj
+    return {k: obj[k] for k in self.columns if k in obj}
+
+  def __call__(self, line: bytes) -> Optional[Dict[str, Any]]:
+    """ Returns the decoded record, or None if it doesn't match. """
+    if not self.prefilter(line):
+      return None
+    obj = json_loads(line)
+    return self.project(obj) if self.matches(obj) else None
+
+
+def _decode_lines(lines: Iterable[bytes],
+                  record_filter: Optional[_RecordFilter] = None):
+  """ Decodes jsonl lines, skipping blank (whitespace-only) lines. """
+  decode = json_loads if record_filter is None else record_filter
+  for line in lines:
+    try:
+      obj = decode(line)
+    except ValueError:
+      # only check for blank lines on failure, keeping the common path fast.
+      if line.strip():
+        raise
+      continue
+    if obj is not None:
+      yield obj
+
+
+def _decode_jsonl_range(
+    task: Tuple[str, int, int, Optional[_RecordFilter]]
+) -> List[Dict[str, Any]]:
+  """ Decode all records within a single byte range of a jsonl file.
+
+  Args:
+    task: A tuple containing `(path, start, end, record_filter)`. The range
+      must be aligned to line boundaries (see `_jsonl_byte_ranges`).
+
+  Returns:
+    A list of the decoded records within the range.
+  """
+  path, start, end, record_filter = task
+  with open(path, 'rb') as f:
+    f.seek(start)
+    lines = f.read(end - start).splitlines()
+  return list(_decode_lines(lines, record_filter))
+
+
+def _load_jsonl_parallel(
+    path: Union[Path, str], num_workers: int, chunk_size: int, ordered: bool,
+    record_filter: Optional[_RecordFilter]
+) -> Generator[Dict[str, Any], None, None]:
+  tasks = [(str(path), start, end, record_filter)
+           for start, end in _jsonl_byte_ranges(path, chunk_size)]
+  with mp.Pool(num_workers) as p:
+    imap = p.imap if ordered else p.imap_unordered
+    for records in imap(_decode_jsonl_range, tasks):
+      yield from records
+    # shutdown cleanly, exiting the context manager terminates the workers.
+    p.close()
+    p.join()
+
+
+class LazyRecord(Mapping):
+  """ A read-only jsonl record which is decoded on first access.
+
+  The record holds a zero-copy `memoryview` of its line in a memory-mapped
+  file (see `load_jsonl(..., memory_map=True)`). The line is only parsed once a
+  field is accessed, after which the decoded record is kept.
+  """
+  __slots__ = ('_raw', '_value')
+
+  def __init__(self, raw: memoryview):
+    self._raw = raw
+    self._value = None
+
+  @property
+  def raw(self) -> memoryview:
+    """ The undecoded bytes of the record. """
+    return self._raw
+
+  def _decoded(self) -> Dict[str, Any]:
+    if self._value is None:
+      self._value = json_loads(self._raw)
+    return self._value
+
+  def __getitem__(self, key):
+    return self._decoded()[key]
+
+  def __iter__(self):
+    return iter(self._decoded())
+
+  def __len__(self) -> int:
+    return len(self._decoded())
+
+  def __repr__(self) -> str:
+    if self._value is None:
+      return f'LazyRecord(<{len(self._raw)} bytes>)'
+    return f'LazyRecord({self._value!r})'
+
+
+def _is_blank(mm: mmap.mmap, start: int, end: int) -> bool:
+  # only copy the line when it starts with whitespace.
+  return mm[start] in b' \t\r\n' and not mm[start:end].strip()
+
+
+def _load_jsonl_mmap(
+    path: Union[Path, str],
+    record_filter: Optional[_RecordFilter] = None
+) -> Generator[LazyRecord, None, None]:
+  with open(path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return
+    # The mapping remains open for as long as any record references it.
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  buf, size, start = memoryview(mm), len(mm), 0
+  while start < size:
+    end = mm.find(b'\n', start)
+    end = size if end == -1 else end + 1
+    # skip blank lines, and search for prefilter needles without copying.
+    if not _is_blank(mm, start, end) and (record_filter is None or all(
+        mm.find(n, start, end) != -1 for n in record_filter.needles)):
+      record = LazyRecord(buf[start:end])
+      if record_filter is None or record_filter.matches(record):
+        yield record
+    start = end
+
+
+def load_jsonl(
+    path: Union[Path, str],
+    num_workers: Optional[int] = None,
+    chunk_size: int = 16 * 2**20,
+    ordered: bool = True,
+    memory_map: bool = False,
+    compression: Optional[str] = 'infer',
+    restore_arrays: bool = False,
+    memory_map_arrays: bool = False,
+    columns: Optional[List[str]] = None,
+    where: Union[None, Dict[str, Any], Callable[[Any], bool]] = None,
+    cache: bool = True,
+) -> Generator[Dict[str, Any], None, None]:
+  """ Load from jsonl. Blank lines are skipped.
+
+  Args:
+    path: Path to the jsonl file
+    num_workers: Number of processes to use for decoding. If provided, the file
+      is split into newline-aligned byte ranges of roughly `chunk_size` bytes,
+      which are decoded in a process pool. Defaults to decoding serially on the
+      calling thread.
+    chunk_size: Approximate size (in bytes) of each range when decoding in
+      parallel. Each worker holds at most one decoded range in memory at once.
+    ordered: Predicate indicating whether records should be yielded in their
+      original order when decoding in parallel. Unordered results are yielded
+      as soon as any range is decoded.
+    memory_map: Predicate indicating whether to memory-map the file and yield
+      read-only `LazyRecord`s, which are only decoded once a field is accessed.
+      Processes mapping the same file share a single copy in the page cache.
+    compression: Compression codec, detected from the contents of the file by
+      default. Compressed files are decompressed while streaming, and do not
+      support `num_workers` or `memory_map`. See `_open` for details.
+    restore_arrays: Predicate indicating whether to load arrays written to a
+      sidecar by `dump_jsonl(..., arrays_threshold=...)`. Otherwise the
+      references to them are returned as-is. Not supported with `memory_map`.
+    memory_map_arrays: Predicate indicating whether restored arrays should be
+      read-only memory maps of the sidecar, rather than read into memory.
+    columns: Keys to keep in each record. Defaults to all keys. Not supported
+      with `memory_map`.
+    where: Either a dict of `{key: value}` pairs which must all be equal to the
+      values of a record for it to be kept, or a function of the record
+      returning whether to keep it. For dicts, lines which cannot match are
+      rejected with a substring search before they are decoded, and booleans
+      and integers only match values of the same type (e.g. `1` matches
+      neither `true` nor `1.0`). Functions must be picklable when using
+      `num_workers`.
+    cache: Predicate indicating whether to use the load cache, if it is
+      enabled (see `enable_load_cache`). Calls with `memory_map`, `columns` or
+      `where` are never cached.
+
+  Example:
+    >>> load_jsonl('results.jsonl', columns=['idx', 'acc'],
+    ...            where={'split': 'test'})
+
+  """
+  if (cache and _load_cache.enabled and not memory_map and columns is None and
+      where is None):
+    options = ('jsonl', compression, restore_arrays, memory_map_arrays)
+    yield from _load_cache.get(
+        path, options, lambda: list(
+            load_jsonl(path,
+                       num_workers,
+                       chunk_size,
+                       compression=compression,
+                       restore_arrays=restore_arrays,
+                       memory_map_arrays=memory_map_arrays,
+                       cache=False)))
+    return
+
+  if restore_arrays and _array_sidecar_path(path).is_file():
+    if memory_map:
+      raise ValueError('memory_map does not support restore_arrays.')
+    arrays = _ArraySidecarReader(path, memory_map_arrays)
+    records = load_jsonl(path,
+                         num_workers,
+                         chunk_size,
+                         ordered,
+                         compression=compression,
+                         columns=columns,
+                         where=where,
+                         cache=False)
+    yield from map(arrays.restore, records)
+    return
+
+  record_filter = None
+  if columns is not None or where is not None:
+    if memory_map and columns is not None:
+      raise ValueError('memory_map does not support columns.')
+    record_filter = _RecordFilter(columns, where)
+
+  compression = _infer_compression(path, compression)
+  parallel = num_workers is not None and num_workers > 1
+  if compression is not None and (parallel or memory_map):
+    raise ValueError('num_workers and memory_map are not supported for '
+                     f'{compression} compressed files.')
+
+  if memory_map:
+    if parallel:
+      raise ValueError('memory_map does not support num_workers.')
+    yield from _load_jsonl_mmap(path, record_filter)
+    return
+
+  if parallel:
+    yield from _load_jsonl_parallel(path, num_workers, chunk_size, ordered,
+                                    record_filter)
+    return
+
+  with _open(path, 'rb', compression) as f:
+    yield from _decode_lines(f, record_filter)
+
+
+class _SharedMemory(shared_memory.SharedMemory):
+  """ A `SharedMemory` segment which may be closed while views are alive. """
+
+  def close(self):
+    try:
+      super().close()
+    except BufferError:
+      # Views of the segment are still referenced. Dropping the mapping here
+      # unmaps it once they are garbage collected.
+      self._mmap = None
+      super().close()
+
+
+def _attach_shared_memory(name: str) -> _SharedMemory:
+  try:
+    # Only the creator should unlink the segment (python 3.13+).
+    return _SharedMemory(name, track=False)
+  except TypeError:
+    return _SharedMemory(name)
+
+
+class SharedJsonlDataset(Sequence):
+  """ Records of a jsonl file, decoded once into shared memory.
+
+  The records are re-encoded as compact json and packed into a single
+  `multiprocessing.shared_memory` segment, together with their offsets:
+    `[num_records: uint64][offsets: uint64 * (num_records + 1)][records]`
+  Indexing returns read-only `LazyRecord` views of the segment, which are only
+  decoded once a field is accessed. Datasets are pickled by the name of their
+  segment, so worker processes (forked or spawned) attach to the same copy
+  rather than each holding their own, and memory use does not grow with the
+  number of workers.
+
+  The process which creates the dataset with `from_jsonl` owns the segment and
+  should `unlink` it once all workers are done, e.g. by using the dataset as a
+  context manager. Records remain valid after `close`, and the segment stays
+  mapped until they are garbage collected.
+
+  Example:
+    >>> with SharedJsonlDataset.from_jsonl('annotations.jsonl') as ds:
+    ...   with mp.Pool(8) as p:
+    ...     p.map(process, [(ds, i) for i in range(len(ds))])
+
+  Args:
+    name: Name of an existing segment to attach to.
+  """
+
+  def __init__(self, name: str):
+    self._shm = _attach_shared_memory(name)
+    self._owner = False
+    self._init_views()
+
+  def _init_views(self):
+    buf = self._shm.buf
+    n = int.from_bytes(buf[:8], 'little')
+    self._offsets = buf[8:16 + 8 * n].cast('Q')
+    self._data = buf[16 + 8 * n:]
+
+  @classmethod
+  def from_jsonl(cls,
+                 path: Union[Path, str],
+                 name: Optional[str] = None,
+                 **kwargs) -> 'SharedJsonlDataset':
+    """ Loads a jsonl file into a new shared memory segment.
+
+    Args:
+      path: Path to the jsonl file.
+      name: Name of the segment. Defaults to a random name.
+      **kwargs: Additional arguments to `load_jsonl`, e.g. `num_workers` or
+        `columns`.
+    """
+    records = [
+        json_dumps(record).encode('utf-8')
+        for record in load_jsonl(path, **kwargs)
+    ]
+    offsets = array('Q', [0])
+    for record in records:
+      offsets.append(offsets[-1] + len(record))
+    header = len(records).to_bytes(8, 'little') + offsets.tobytes()
+    shm = _SharedMemory(name, create=True, size=len(header) + offsets[-1])
+    shm.buf[:len(header)] = header
+    for start, record in zip(offsets, records):
+      shm.buf[len(header) + start:len(header) + start + len(record)] = record
+
+    self = cls.__new__(cls)
+    self._shm, self._owner = shm, True
+    self._init_views()
+    return self
+
+  @property
+  def name(self) -> str:
+    return self._shm.name
+
+  @property
+  def nbytes(self) -> int:
+    return self._shm.size
+
+  def __len__(self) -> int:
+    return len(self._offsets) - 1
+
+  def _read(self, idx: int) -> LazyRecord:
+    return LazyRecord(self._data[self._offsets[idx]:self._offsets[idx + 1]])
+
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return [self._read(i) for i in range(*idx.indices(len(self)))]
+    n = len(self)
+    if idx < 0:
+      idx += n
+    if not 0 <= idx < n:
+      raise IndexError('SharedJsonlDataset index out of range')
+    return self._read(idx)
+
+  def __iter__(self) -> Iterator[LazyRecord]:
+    for idx in range(len(self)):
+      yield self._read(idx)
+
+  def __reduce__(self):
+    return (SharedJsonlDataset, (self.name,))
+
+  def close(self):
+    """ Detaches from the segment, without freeing it.
+
+    Records which are still referenced keep the segment mapped until they are
+    garbage collected.
+    """
+    self._offsets.release()
+    self._data.release()
+    self._shm.close()
+
+  def __del__(self):
+    # The views must be released before `SharedMemory.__del__` closes the
+    # segment, which would otherwise fail.
+    if hasattr(self, '_data'):
+      self._offsets.release()
+      self._data.release()
+
+  def unlink(self):
+    """ Frees the segment once all processes have closed it. """
+    self._shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    try:
+      self.close()
+    finally:
+      if self._owner:
+        self.unlink()
+
+
+class _ColumnBuffer:
+  """ A growable, typed buffer for a single column of a jsonl file.
+
+  Values are stored in an `array.array` as long as they are all booleans,
+  integers or floats (promoting bool -> int -> float as needed), and otherwise
+  fall back to a list of objects. Missing values are tracked with a mask.
+  """
+  __slots__ = ('values', 'mask', 'kind', 'num_missing')
+
+  # kind -> (typecode, fill value)
+  _kinds = {bool: ('b', False), int: ('q', 0), float: ('d', 0.0)}
+  _order = (bool, int, float)
+
+  def __init__(self):
+    self.values = None
+    self.mask = array('b')
+    self.kind = None
+    self.num_missing = 0
+
+  def __len__(self) -> int:
+    return len(self.mask)
+
+  def _promote(self, kind):
+    if self.kind is object:
+      return
+    if self.kind is None:
+      self.values = array(self._kinds[kind][0]) if kind in self._kinds else []
+    elif kind not in self._kinds or self.kind not in self._kinds:
+      self.values = list(self.values)
+      kind = object
+    elif self._order.index(kind) > self._order.index(self.kind):
+      self.values = array(self._kinds[kind][0], self.values)
+    else:
+      return
+    self.kind = kind
+
+  def pad(self, n: int):
+    """ Mark values as missing until the column has length `n`. """
+    num_pad = n - len(self)
+    if num_pad <= 0:
+      return
+    if self.kind is None:
+      self._promote(bool)
+    fill = self._kinds[self.kind][1] if self.kind in self._kinds else None
+    self.values.extend([fill] * num_pad)
+    self.mask.extend([1] * num_pad)
+    self.num_missing += num_pad
+
+  def append(self, value):
+    if value is None:
+      self.pad(len(self) + 1)
+      return
+    kind = type(value)
+    if kind not in self._kinds:
+      kind = object
+    if kind is not self.kind:
+      self._promote(kind)
+    try:
+      self.values.append(value)
+    except OverflowError:
+      # integers outside of the int64 range.
+      self._promote(object)
+      self.values.append(value)
+    self.mask.append(0)
+
+  def to_numpy(self):
+    if self.kind is None:
+      self._promote(bool)
+    if self.kind in self._kinds:
+      values = np.frombuffer(self.values, dtype=self.values.typecode)
+      if self.kind is bool:
+        values = values.view(np.bool_)
+    else:
+      values = np.empty(len(self.values), dtype=object)
+      values[:] = self.values
+    if self.num_missing:
+      mask = np.frombuffer(self.mask, dtype=np.int8).view(np.bool_)
+      return np.ma.MaskedArray(values, mask=mask)
+    return values
+
+
+@require('numpy')
+def load_jsonl_columns(path: Union[Path, str],
+                       columns: Optional[List[str]] = None) -> Dict[str, Any]:
+  """ Load a jsonl file of flat records into a dict of NumPy arrays.
+
+  Values are accumulated directly into typed, growable buffers (one per key)
+  rather than keeping a dict per record. Columns containing only booleans,
+  integers or floats are returned as arrays of the corresponding dtype, while
+  all other columns use `dtype=object`. Columns where some records are missing
+  the key (or have a value of `null`) are returned as masked arrays.
+
+  Args:
+    path: Path to the jsonl file.
+    columns: Keys to load. Defaults to all keys found in the file. Requested
+      keys which are not present in any record are returned as fully-masked
+      columns.
+
+  Returns:
+    A dict mapping each key to an array with one entry per record.
+  """
+  buffers = {k: _ColumnBuffer() for k in columns or []}
+  n = 0
+  for obj in load_jsonl(path):
+    for k, v in obj.items():
+      buf = buffers.get(k)
+      if buf is None:
+        if columns is not None:
+          continue
+        buf = buffers[k] = _ColumnBuffer()
+      buf.pad(n)
+      buf.append(v)
+    n += 1
+  for buf in buffers.values():
+    buf.pad(n)
+  return {k: buf.to_numpy() for k, buf in buffers.items()}
 
-  ret = list(T.map(lambda x: T.get_in(x.split('/'), loaded), loadkeys))
-  return ret
 
+@require('pandas')
+def load_jsonl_df(path: Union[Path, str],
+                  chunk_size: int = 65536,
+                  columns: Optional[List[str]] = None,
+                  compression: Optional[str] = 'infer',
+                  **kwargs):
+  """ Load a jsonl file into a DataFrame, reading blocks of rows at a time.
+
+  Each block is parsed with `pandas.read_json` into typed columns (optionally
+  projected to `columns`), and the blocks are concatenated at the end. This
+  avoids materializing the whole file as text or as a list of dicts.
 
-def dump_jsonl(path: Union[Path, str],
-               data: list[dict[str, Any]],
-               relaxed: bool = True) -> None:
-  """ Dump to jsonl.
   Args:
     path: Path to the jsonl file.
-    data: object to dump.
-    relaxed: predicate indicating whether to throw an error when part of the
-      data cannot be encoded using CustomJSONEncoder.
+    chunk_size: Number of rows to parse at once.
+    columns: Columns to keep. Defaults to all columns.
+    compression: Compression codec, detected from the contents of the file by
+      default. See `_open` for details.
+    **kwargs: Additional arguments to `pandas.read_json`, e.g. `dtype`.
+
+  Returns:
+    A `pandas.DataFrame` with one row per record.
   """
-  path = Path(path)
-  path.parent.mkdir(exist_ok=True, parents=True)
-  encoder_cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
-  # maybe it's a datframe
-  if str(type(data)) == "<class 'pandas.core.frame.DataFrame'>":
-    data.to_json(  # pytype: disable=attribute-error
-        path, orient='records', lines=True)
-  else:
-    with open(path, 'w', encoding='utf-8') as f:
-      for obj in data:
-        f.write(json.dumps(obj, cls=encoder_cls) + '\n')
+  blocks = []
+  with _open(path, 'r', compression) as f:
+    with pd.read_json(f, lines=True, chunksize=chunk_size, **kwargs) as reader:
+      for block in reader:
+        if columns is not None:
+          block = block.reindex(columns=columns)
+        blocks.append(block)
+  if not blocks:
+    return pd.DataFrame(columns=columns)
+  return pd.concat(blocks, ignore_index=True)
 
 
-def load_jsonl(path: Union[Path, str]) -> Generator[Dict[str, Any], None, None]:
-  """ Load from jsonl.
+_ARROW_CACHE_SUFFIXES = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+
+def default_arrow_cache_dir() -> Path:
+  """ Returns the default directory for `load_jsonl_arrow`. """
+  cache_home = os.environ.get('XDG_CACHE_HOME', '~/.cache')
+  return Path(cache_home).expanduser() / 'labtools' / 'jsonl'
+
+
+def _file_fingerprint(path: Path, fingerprint: str) -> str:
+  """ Computes the fingerprint of a file's current version. """
+  if fingerprint == 'stat':
+    st = path.stat()
+    return compute_obj_hash({'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+  elif fingerprint == 'content':
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+      for block in iter(lambda: f.read(2**20), b''):
+        h.update(block)
+    return h.hexdigest()
+  raise ValueError(f'Unknown fingerprint: {fingerprint!r}')
+
+
+def _evict_arrow_cache(cache_dir: Path, max_cache_bytes: int,
+                       keep: Path) -> None:
+  """ Removes the least recently used entries until under `max_cache_bytes`.
+
+  Entries are touched on every hit, so their mtime is their last use. `keep`
+  is never removed, even if it alone exceeds the limit.
+  """
+  entries = []
+  for entry in os.scandir(cache_dir):
+    if entry.name.endswith(tuple(_ARROW_CACHE_SUFFIXES.values())):
+      st = entry.stat()
+      entries.append((st.st_mtime_ns, st.st_size, Path(entry.path)))
+  total = sum(size for _, size, _ in entries)
+  for _, size, entry in sorted(entries):
+    if total <= max_cache_bytes:
+      break
+    if entry != keep:
+      logging.debug('Evicting cached table at %s', entry)
+      entry.unlink(missing_ok=True)
+      total -= size
+
+
+@require('pyarrow')
+def load_jsonl_arrow(path: Union[Path, str],
+                     columns: Optional[List[str]] = None,
+                     cache_dir: Union[None, Path, str] = None,
+                     cache_format: str = 'arrow',
+                     fingerprint: str = 'stat',
+                     max_cache_bytes: Optional[int] = 2**33,
+                     compression: Optional[str] = 'infer'):
+  """ Load a jsonl file as a `pyarrow.Table`, caching the converted table.
+
+  The first read parses the file with `pyarrow.json` and writes the table to
+  `cache_dir`. Later reads of the same version of the file memory map the
+  cached table instead, which is zero-copy for the Arrow IPC format. Cache
+  entries are keyed by the absolute path and a fingerprint of the file, so any
+  change to the file invalidates its entry, and stale entries for the same
+  path are removed when the new entry is written.
+
+  Values of a column must have compatible types across records (e.g. ints and
+  floats), otherwise `pyarrow.ArrowInvalid` is raised.
 
   Args:
-    path: Path to the jsonl file
+    path: Path to the jsonl file.
+    columns: Columns to return. Defaults to all columns.
+    cache_dir: Cache directory. Defaults to `default_arrow_cache_dir()`.
+    cache_format: Format of the cached table, either `'arrow'` (Arrow IPC,
+      memory mapped without copies) or `'parquet'` (smaller, but decoded on
+      read).
+    fingerprint: How to detect changes to the file. `'stat'` uses the size and
+      modification time of the file, while `'content'` hashes its contents.
+    max_cache_bytes: Maximum total size of the cache. The least recently used
+      entries are evicted after writing a new entry. None disables eviction.
+    compression: Compression codec, detected from the contents of the file by
+      default. See `_open` for details.
 
+  Returns:
+    A `pyarrow.Table` with one row per record.
   """
-  with open(path, 'r', encoding='utf-8') as f:
-    for line in f:
-      yield json.loads(line)
+  from pyarrow import ipc  # pylint: disable=import-outside-toplevel
+  from pyarrow import json as pa_json  # pylint: disable=import-outside-toplevel
+  from pyarrow import parquet as pq  # pylint: disable=import-outside-toplevel
+
+  if cache_format not in _ARROW_CACHE_SUFFIXES:
+    raise ValueError(f'Unknown format: {cache_format!r}')
+  path = Path(path).absolute()
+  cache_dir = Path(cache_dir or default_arrow_cache_dir())
+  cache_dir.mkdir(parents=True, exist_ok=True)
+
+  key = compute_obj_hash(str(path))[:16]
+  version = _file_fingerprint(path, fingerprint)[:16]
+  suffix = _ARROW_CACHE_SUFFIXES[cache_format]
+  entry = cache_dir / f'{key}-{version}{suffix}'
+
+  if entry.is_file():
+    profiler.record('arrow_cache/hits', 1)
+    os.utime(entry)
+  else:
+    profiler.record('arrow_cache/misses', 1)
+    with _open(path, 'rb', compression) as f:
+      table = pa_json.read_json(f)
+    tmp = entry.with_name(f'.{entry.name}.{os.getpid()}.tmp')
+    if cache_format == 'arrow':
+      with pa.OSFile(str(tmp), 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+          writer.write_table(table)
+    else:
+      pq.write_table(table, tmp)
+    os.replace(tmp, entry)
+    for stale in cache_dir.glob(f'{key}-*{suffix}'):
+      if stale != entry:
+        stale.unlink(missing_ok=True)
+    if max_cache_bytes is not None:
+      _evict_arrow_cache(cache_dir, max_cache_bytes, keep=entry)
+
+  if cache_format == 'arrow':
+    table = ipc.open_file(pa.memory_map(str(entry))).read_all()
+    return table if columns is None else table.select(columns)
+  return pq.read_table(entry, columns=columns, memory_map=True)
 
 
 def dump_json(path: Union[Path, str],
               data: dict[str, Any],
               relaxed: bool = True,
-              indent=4) -> None:
+              indent=4,
+              compression: Optional[str] = 'infer',
+              arrays_threshold: Optional[int] = None) -> None:
   """ Dump to json.
   Args:
     path: Path to the jsonl file.
@@ -104,18 +1661,685 @@ def dump_json(path: Union[Path, str],
     relaxed: predicate indicating whether to throw an error when part of the
       data cannot be encoded using CustomJSONEncoder.
       indent: json indentation.
+    compression: Compression codec, inferred from the suffix of `path` by
+      default. See `_open` for details.
+    arrays_threshold: If provided, arrays and tensors of at least this many
+      bytes are written out-of-line to a binary `<path>.arrays` sidecar rather
+      than expanded to lists. Use `load_json(..., restore_arrays=True)` to
+      load them.
   """
   path = Path(path)
   path.parent.mkdir(exist_ok=True, parents=True)
   encoder_cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
-  path.write_text(json.dumps(data, cls=encoder_cls, indent=indent))
+  if arrays_threshold is not None:
+    arrays = _ArraySidecarWriter(path, arrays_threshold)
+    try:
+      data = arrays.externalize(data)
+    finally:
+      arrays.close()
+  with _open(path, 'w', compression) as f:
+    f.write(json_dumps(data, cls=encoder_cls, indent=indent))
 
 
-def maybe_rlocation(path: str) -> str:
+def load_json(path: Union[Path, str],
+              restore_arrays: bool = False,
+              memory_map_arrays: bool = False,
+              compression: Optional[str] = 'infer',
+              cache: bool = True) -> Any:
+  """ Load from json.
+
+  Args:
+    path: Path to the json file.
+    restore_arrays: Predicate indicating whether to load arrays written to a
+      sidecar by `dump_json(..., arrays_threshold=...)`. Otherwise the
+      references to them are returned as-is.
+    memory_map_arrays: Predicate indicating whether restored arrays should be
+      read-only memory maps of the sidecar, rather than read into memory.
+    compression: Compression codec, detected from the contents of the file by
+      default. See `_open` for details.
+    cache: Predicate indicating whether to use the load cache, if it is
+      enabled (see `enable_load_cache`).
+  """
+
+  def load_fn():
+    with _open(path, 'r', compression) as f:
+      obj = json_loads(f.read())
+    if restore_arrays and _array_sidecar_path(path).is_file():
+      obj = _ArraySidecarReader(path, memory_map_arrays).restore(obj)
+    return obj
+
+  if cache and _load_cache.enabled:
+    options = ('json', compression, restore_arrays, memory_map_arrays)
+    return _load_cache.get(path, options, load_fn)
+  return load_fn()
+
+
+def _shard_path(path: Path, shard: int) -> Path:
+  """ Inserts a shard number before the suffix(es) of a path.
+
+  Example:
+    >>> _shard_path(Path('out/results.jsonl.gz'), 3)
+        PosixPath('out/results-00003.jsonl.gz')
+  """
+  stem, dot, suffixes = path.name.partition('.')
+  return path.with_name(f'{stem}-{shard:05d}{dot}{suffixes}')
+
+
+class JsonlWriter:
+  """ Streaming jsonl writer with buffering, flush policies and rotation.
+
+  Records are encoded as they are written and accumulated in a write buffer,
+  which is flushed to the file once any of the flush conditions are met. Unlike
+  `dump_jsonl`, this never requires holding all records in memory.
+
+  Example:
+    >>> with JsonlWriter('logs/train.jsonl', flush_secs=30) as writer:
+    ...   for step in range(num_steps):
+    ...     writer.write({'step': step, 'loss': train_step()})
+
+  Args:
+    path: Path to the jsonl file. When `max_shard_bytes` is set, this is used as
+      a template for the shard paths (see `_shard_path`).
+    relaxed: predicate indicating whether to throw an error when part of the
+      data cannot be encoded using CustomJSONEncoder.
+    flush_bytes: Flush once the buffer holds at least this many bytes.
+    flush_records: Flush after this many records have been buffered.
+    flush_secs: Flush on the first write at least this many seconds after the
+      previous flush. Note this is checked on write, there is no timer.
+    fsync: Predicate indicating whether to `os.fsync` the file on each flush.
+    max_shard_bytes: If provided, roll over to a new shard file before a shard
+      would exceed this size (before compression). Shards always contain at
+      least one record.
+    compression: Compression codec, inferred from the suffix of `path` by
+      default. See `_open` for details.
+  """
+
+  def __init__(self,
+               path: Union[Path, str],
+               relaxed: bool = True,
+               flush_bytes: int = 2**20,
+               flush_records: Optional[int] = None,
+               flush_secs: Optional[float] = None,
+               fsync: bool = False,
+               max_shard_bytes: Optional[int] = None,
+               compression: Optional[str] = 'infer'):
+    self.path = Path(path)
+    self.compression = _infer_compression(path, compression, mode='w')
+    self.path.parent.mkdir(exist_ok=True, parents=True)
+    self.encoder_cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
+    self.flush_bytes = flush_bytes
+    self.flush_records = flush_records
+    self.flush_secs = flush_secs
+    self.fsync = fsync
+    self.max_shard_bytes = max_shard_bytes
+    self.paths: List[Path] = []
+    self.num_records = 0
+    self.shard_num_records: List[int] = []
+
+    self._buffer: List[bytes] = []
+    self._buffer_bytes = 0
+    self._shard_bytes = 0
+    self._last_flush = time.monotonic()
+    self._file = None
+    self._open_next()
+
+  def _open_next(self):
+    if self._file is not None:
+      self._file.close()
+    if self.max_shard_bytes is None:
+      path = self.path
+    else:
+      path = _shard_path(self.path, len(self.paths))
+    self._file = _open(path, 'wb', self.compression)
+    self.paths.append(path)
+    self.shard_num_records.append(0)
+    self._shard_bytes = 0
+
+  def _check_open(self):
+    if self._file is None:
+      raise ValueError('I/O operation on closed JsonlWriter')
+
+  def write(self, obj: Any) -> None:
+    """ Write a single record. """
+    self._check_open()
+    line = (json_dumps(obj, cls=self.encoder_cls) + '\n').encode('utf-8')
+    if (self.max_shard_bytes is not None and self._shard_bytes and
+        self._shard_bytes + len(line) > self.max_shard_bytes):
+      self.flush()
+      self._open_next()
+    self._buffer.append(line)
+    self._buffer_bytes += len(line)
+    self._shard_bytes += len(line)
+    self.num_records += 1
+    self.shard_num_records[-1] += 1
+    if self._should_flush():
+      self.flush()
+
+  def write_many(self, objs: Iterable[Any]) -> None:
+    """ Write a batch of records. """
+    for obj in objs:
+      self.write(obj)
+
+  def _should_flush(self) -> bool:
+    if self._buffer_bytes >= self.flush_bytes:
+      return True
+    if (self.flush_records is not None and
+        len(self._buffer) >= self.flush_records):
+      return True
+    return (self.flush_secs is not None and
+            time.monotonic() - self._last_flush >= self.flush_secs)
+
+  def flush(self) -> None:
+    """ Write all buffered records to the current file. """
+    self._check_open()
+    if self._buffer:
+      self._file.write(b''.join(self._buffer))
+      self._buffer, self._buffer_bytes = [], 0
+    self._file.flush()
+    if self.fsync:
+      os.fsync(self._file.fileno())
+    self._last_flush = time.monotonic()
+
+  def close(self) -> None:
+    if self._file is not None:
+      self.flush()
+      self._file.close()
+      self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def _jsonl_manifest_path(path: Union[Path, str]) -> Path:
+  return Path(str(path) + '.manifest')
+
+
+def _write_jsonl_shard(
+    task: Tuple[Path, List[Any], bool, Optional[str], str]) -> int:
+  """ Writes a single shard, returning its size in bytes. """
+  path, records, relaxed, compression, backend = task
+  cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
+  with _open(path, 'wb', compression) as f:
+    for batch in T.partition_all(1024, records):
+      f.write(''.join(json_dumps(obj, cls=cls, backend=backend) + '\n'
+                      for obj in batch).encode('utf-8'))
+  return os.path.getsize(path)
+
+
+def dump_jsonl_sharded(path: Union[Path, str],
+                       data: Iterable[Any],
+                       num_shards: Optional[int] = None,
+                       max_shard_bytes: Optional[int] = None,
+                       relaxed: bool = True,
+                       compression: Optional[str] = 'infer',
+                       num_workers: Optional[int] = None) -> Path:
+  """ Dump to a sharded jsonl dataset.
+
+  Records are written to shard files named after `path` (see `_shard_path`),
+  which are listed in a `<path>.manifest` file along with their number of
+  records and size. Shards hold consecutive records, so reading them in order
+  gives back the original order. Use `load_jsonl_sharded` to read the dataset.
+
+  Args:
+    path: Path of the dataset, used as a template for the shard paths.
+    data: Records to write.
+    num_shards: Number of shards to split `data` into, which are written
+      concurrently. This requires holding all records in memory.
+    max_shard_bytes: Alternatively, stream `data` into shards of up to this
+      many bytes (before compression), as in `JsonlWriter`.
+    relaxed: predicate indicating whether to throw an error when part of the
+      data cannot be encoded using CustomJSONEncoder.
+    compression: Compression codec, inferred from the suffix of `path` by
+      default. See `_open` for details.
+    num_workers: Number of processes to write shards with. By default shards
+      are written by one thread each, which overlaps I/O and compression.
+
+  Returns:
+    The path to the manifest.
+
+  Example:
+    >>> dump_jsonl_sharded('out/preds.jsonl.zst', preds, num_shards=16)
+  """
+  if (num_shards is None) == (max_shard_bytes is None):
+    raise ValueError('Exactly one of num_shards and max_shard_bytes must be '
+                     'provided.')
+  path = Path(path)
+  path.parent.mkdir(exist_ok=True, parents=True)
+  compression = _infer_compression(path, compression, mode='w')
+
+  if num_shards is not None:
+    data = data if isinstance(data, Sequence) else list(data)
+    bounds = [len(data) * i // num_shards for i in range(num_shards + 1)]
+    shard_paths = [_shard_path(path, i) for i in range(num_shards)]
+    shard_num_records = [end - start for start, end in zip(bounds, bounds[1:])]
+    tasks = [(shard_path, data[start:end], relaxed, compression,
+              get_json_backend())
+             for shard_path, start, end in zip(shard_paths, bounds, bounds[1:])]
+    if num_workers is not None and num_workers > 1:
+      pool = mp.Pool(min(num_workers, num_shards))
+    else:
+      pool = ThreadPool(min(num_shards, os.cpu_count() or 1))
+    with pool as p:
+      shard_num_bytes = p.map(_write_jsonl_shard, tasks)
+      p.close()
+      p.join()
+  else:
+    with JsonlWriter(path,
+                     relaxed=relaxed,
+                     max_shard_bytes=max_shard_bytes,
+                     compression=compression) as writer:
+      writer.write_many(data)
+    shard_paths, shard_num_records = writer.paths, writer.shard_num_records
+    shard_num_bytes = [os.path.getsize(p) for p in shard_paths]
+
+  manifest = {
+      'num_records': sum(shard_num_records),
+      'shards': [{
+          'path': shard_path.name,
+          'num_records': num_records,
+          'num_bytes': num_bytes,
+      } for shard_path, num_records, num_bytes in zip(
+          shard_paths, shard_num_records, shard_num_bytes)],
+  }
+  manifest_path = _jsonl_manifest_path(path)
+  tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+  with open(tmp_path, 'w', encoding='utf-8') as f:
+    f.write(json_dumps(manifest, indent=2))
+  os.replace(tmp_path, manifest_path)
+  return manifest_path
+
+
+def _assign_shards(sizes: List[int], num_shards: int) -> List[List[int]]:
+  """ Assigns shards to readers, balancing the number of bytes per reader.
+
+  Shards are assigned largest first to the reader with the fewest bytes so far
+  (ties broken by reader index), which is deterministic across readers.
+  """
+  loads = [(0, i) for i in range(num_shards)]
+  assignment = [[] for _ in range(num_shards)]
+  for shard in sorted(range(len(sizes)), key=lambda i: (-sizes[i], i)):
+    load, reader = min(loads)
+    loads[reader] = (load + sizes[shard], reader)
+    assignment[reader].append(shard)
+  return [sorted(shards) for shards in assignment]
+
+
+def list_jsonl_shards(path: Union[Path, str],
+                      shard_index: int = 0,
+                      num_shards: int = 1) -> List[Path]:
+  """ Lists the shard files of a dataset written by `dump_jsonl_sharded`.
+
+  Args:
+    path: Path of the dataset, as passed to `dump_jsonl_sharded`, or of its
+      manifest.
+    shard_index: Index of the reader, in `[0, num_shards)`.
+    num_shards: Number of readers the shard files are split between. Each
+      reader is assigned whole files, balanced by their size.
+
+  Returns:
+    The paths of the shard files assigned to reader `shard_index`, in order.
+  """
+  if not 0 <= shard_index < num_shards:
+    raise ValueError(f'shard_index must be in [0, {num_shards}), got '
+                     f'{shard_index}.')
+  manifest_path = Path(path)
+  if not manifest_path.name.endswith('.manifest'):
+    manifest_path = _jsonl_manifest_path(path)
+  with open(manifest_path, 'r', encoding='utf-8') as f:
+    shards = json_loads(f.read())['shards']
+  if num_shards > len(shards):
+    logging.warning('Splitting %d shard files between %d readers.',
+                    len(shards), num_shards)
+  assignment = _assign_shards([x['num_bytes'] for x in shards], num_shards)
+  return [
+      manifest_path.with_name(shards[i]['path'])
+      for i in assignment[shard_index]
+  ]
+
+
+def load_jsonl_sharded(path: Union[Path, str],
+                       shard_index: int = 0,
+                       num_shards: int = 1,
+                       **kwargs) -> Generator[Dict[str, Any], None, None]:
+  """ Load from a sharded jsonl dataset written by `dump_jsonl_sharded`.
+
+  Args:
+    path: Path of the dataset, or of its manifest.
+    shard_index: Index of this reader (e.g. the process or host index).
+    num_shards: Number of readers. Each reader only opens the shard files
+      assigned to it by `list_jsonl_shards`.
+    **kwargs: Additional arguments to `load_jsonl`, e.g. `columns` or `where`.
+
+  Example:
+    >>> records = load_jsonl_sharded('out/preds.jsonl.zst',
+    ...                              shard_index=jax.process_index(),
+    ...                              num_shards=jax.process_count())
+  """
+  for shard_path in list_jsonl_shards(path, shard_index, num_shards):
+    yield from load_jsonl(shard_path, **kwargs)
+
+
+def _shuffled_jsonl_records(paths: List[Path], buffer_size: int,
+                            rng: random.Random, cycle_length: int,
+                            num_epochs: Optional[int],
+                            kwargs: Dict[str, Any]) -> Iterator[Any]:
+  """ Interleaves records of `paths` and shuffles them through a buffer. """
+
+  def interleaved():
+    epochs = itertools.count() if num_epochs is None else range(num_epochs)
+    for _ in epochs:
+      pending = deque(rng.sample(paths, len(paths)))
+      active = []
+      num_records = 0
+      while pending or active:
+        while pending and len(active) < cycle_length:
+          active.append(iter(load_jsonl(pending.popleft(), **kwargs)))
+        i = rng.randrange(len(active))
+        try:
+          yield next(active[i])
+          num_records += 1
+        except StopIteration:
+          active[i] = active[-1]
+          active.pop()
+      # Otherwise, repeating forever would never yield a record.
+      if not num_records:
+        return
+
+  buffer = []
+  for record in interleaved():
+    if len(buffer) < buffer_size:
+      buffer.append(record)
+      continue
+    i = rng.randrange(buffer_size)
+    yield buffer[i]
+    buffer[i] = record
+  rng.shuffle(buffer)
+  yield from buffer
+
+
+class _PrefetchError(NamedTuple):
+  exc: BaseException
+
+
+_PREFETCH_DONE = object()
+
+
+def _prefetch(it: Iterator[Any], size: int) -> Iterator[Any]:
+  """ Runs `it` on a background thread, at most `size` items ahead. """
+  q = queue.Queue(size)
+  stop = threading.Event()
+
+  def put(item):
+    while not stop.is_set():
+      try:
+        q.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def produce():
+    try:
+      for item in it:
+        if not put(item):
+          return
+      put(_PREFETCH_DONE)
+    except BaseException as e:  # pylint: disable=broad-except
+      put(_PrefetchError(e))
+
+  thread = threading.Thread(target=produce, daemon=True)
+  thread.start()
+  try:
+    while True:
+      item = q.get()
+      if item is _PREFETCH_DONE:
+        return
+      if isinstance(item, _PrefetchError):
+        raise item.exc
+      yield item
+  finally:
+    stop.set()
+    thread.join()
+
+
+def load_jsonl_shuffled(
+    paths: Union[Path, str, Iterable[Union[Path, str]]],
+    buffer_size: int = 10000,
+    seed: Optional[int] = None,
+    cycle_length: int = 8,
+    prefetch: int = 1024,
+    num_epochs: Optional[int] = 1,
+    shard_index: int = 0,
+    num_shards: int = 1,
+    **kwargs) -> Generator[Dict[str, Any], None, None]:
+  """ Streams records from jsonl files in a shuffled order.
+
+  Files are opened in a random order, `cycle_length` at a time, and records are
+  drawn from a random open file. They are then shuffled through a buffer of
+  `buffer_size` records: each new record replaces a random record of the
+  buffer, which is yielded. Memory is therefore bounded by the buffer, while the
+  order gets closer to uniformly random as the buffer grows. The order is
+  deterministic for a given `seed`.
+
+  Args:
+    paths: Paths to jsonl files, or the path of a dataset written by
+      `dump_jsonl_sharded`.
+    buffer_size: Number of records in the shuffle buffer.
+    seed: Seed for the random number generator.
+    cycle_length: Number of files to read from at once.
+    prefetch: Number of records to prepare ahead of time on a background
+      thread. Set to 0 to read on the calling thread.
+    num_epochs: Number of passes over the files, each in a new order. The
+      buffer carries over between passes. None repeats forever, unless the
+      files (or the records matching `where`) are empty.
+    shard_index: Index of this reader (e.g. the process index).
+    num_shards: Number of readers. Each reader only reads its share of the
+      files (see `list_jsonl_shards`).
+    **kwargs: Additional arguments to `load_jsonl`, e.g. `columns` or `where`.
+
+  Example:
+    >>> for record in load_jsonl_shuffled('data/train.jsonl', seed=0,
+    ...                                   num_epochs=None):
+    ...   train_step(record)
+  """
+  if isinstance(paths, (str, Path)):
+    if (Path(paths).name.endswith('.manifest') or
+        _jsonl_manifest_path(paths).is_file()):
+      paths = list_jsonl_shards(paths, shard_index, num_shards)
+    else:
+      paths = [Path(paths)][shard_index::num_shards]
+  else:
+    paths = list(map(Path, paths))[shard_index::num_shards]
+  if not paths:
+    return
+  records = _shuffled_jsonl_records(paths, buffer_size, random.Random(seed),
+                                    cycle_length, num_epochs, kwargs)
+  if prefetch > 0:
+    records = _prefetch(records, prefetch)
+  yield from records
+
+
+class AsyncWriter:
+  """ Runs writes on background threads fed by a bounded queue.
+
+  Each submitted write returns a `concurrent.futures.Future` immediately. The
+  queue depth, the time writes spend waiting in the queue, and the time spent
+  writing are recorded in the `Profiler` under `async_writer/queue_depth`,
+  `async_writer/queue_latency` and `async_writer/write_time`.
+
+  Example:
+    >>> writer = AsyncWriter(max_queue_size=8)
+    ... for step in range(num_steps):
+    ...   metrics = train_step()
+    ...   dump_json_async(f'metrics/{step}.json', metrics, writer=writer)
+    ... writer.close()
+
+  Args:
+    num_threads: Number of writer threads.
+    max_queue_size: Maximum number of pending writes.
+    backpressure: Behavior when the queue is full. One of
+      `block`: Wait for a slot in the queue.
+      `drop_oldest`: Cancel the oldest pending write. Its future is cancelled.
+      `grow`: Ignore `max_queue_size` and grow the queue without bound.
+  """
+  _backpressure_modes = ('block', 'drop_oldest', 'grow')
+
+  def __init__(self,
+               num_threads: int = 1,
+               max_queue_size: int = 64,
+               backpressure: str = 'block'):
+    if backpressure not in self._backpressure_modes:
+      raise ValueError(f'Backpressure mode {backpressure} not one of '
+                       f'{self._backpressure_modes}.')
+    self.max_queue_size = max_queue_size
+    self.backpressure = backpressure
+    self.num_dropped = 0
+
+    self._queue = deque()
+    self._num_pending = 0
+    self._closed = False
+    self._cond = threading.Condition()
+    self._threads = [
+        threading.Thread(target=self._worker,
+                         name=f'labtools-async-writer-{i}',
+                         daemon=True) for i in range(num_threads)
+    ]
+    for thread in self._threads:
+      thread.start()
+
+  def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+    """ Schedules `fn(*args, **kwargs)` to run on a writer thread. """
+    future = Future()
+    with self._cond:
+      if self._closed:
+        raise RuntimeError('Cannot submit writes to a closed AsyncWriter.')
+      if self.backpressure == 'block':
+        self._cond.wait_for(lambda: len(self._queue) < self.max_queue_size)
+      elif (self.backpressure == 'drop_oldest' and
+            len(self._queue) >= self.max_queue_size):
+        dropped, *_ = self._queue.popleft()
+        dropped.cancel()
+        self._num_pending -= 1
+        self.num_dropped += 1
+        logging.log_every_n(logging.WARNING,
+                            'AsyncWriter queue is full, dropped %d writes.',
+                            100, self.num_dropped)
+      self._queue.append((future, time.time(), fn, args, kwargs))
+      self._num_pending += 1
+      profiler.record('async_writer/queue_depth', len(self._queue))
+      self._cond.notify_all()
+    return future
+
+  def _worker(self):
+    while True:
+      with self._cond:
+        self._cond.wait_for(lambda: self._queue or self._closed)
+        if not self._queue:
+          return
+        future, submitted, fn, args, kwargs = self._queue.popleft()
+        self._cond.notify_all()
+      tick = time.time()
+      profiler.record('async_writer/queue_latency', tick - submitted)
+      if future.set_running_or_notify_cancel():
+        try:
+          future.set_result(fn(*args, **kwargs))
+        except BaseException as e:  # pylint: disable=broad-except
+          logging.exception('Async write failed.')
+          future.set_exception(e)
+      profiler.record('async_writer/write_time', time.time() - tick)
+      with self._cond:
+        self._num_pending -= 1
+        self._cond.notify_all()
+
+  @property
+  def queue_depth(self) -> int:
+    return len(self._queue)
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """ Waits for all pending writes to complete.
+
+    Returns:
+      False if `timeout` expired before all writes completed, otherwise True.
+    """
+    with self._cond:
+      return self._cond.wait_for(lambda: self._num_pending == 0, timeout)
+
+  def close(self) -> None:
+    """ Completes all pending writes and stops the writer threads. """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    for thread in self._threads:
+      thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+_default_async_writer: Optional[AsyncWriter] = None
+_default_async_writer_lock = threading.Lock()
+
+
+def default_async_writer() -> AsyncWriter:
+  """ Returns the shared `AsyncWriter`, which is closed at exit. """
+  global _default_async_writer
+  with _default_async_writer_lock:
+    if _default_async_writer is None:
+      _default_async_writer = AsyncWriter()
+      atexit.register(_default_async_writer.close)
+  return _default_async_writer
+
+
+def dump_json_async(path: Union[Path, str],
+                    data: dict[str, Any],
+                    relaxed: bool = True,
+                    indent=4,
+                    writer: Optional[AsyncWriter] = None) -> Future:
+  """ Dump to json on a background thread.
+
+  See `dump_json` for details. Note that `data` is encoded on the writer thread,
+  so it should not be modified until the returned future completes.
+
+  Args:
+    writer: AsyncWriter to use. Defaults to `default_async_writer()`.
+  """
+  writer = writer or default_async_writer()
+  return writer.submit(dump_json, path, data, relaxed=relaxed, indent=indent)
+
+
+def dump_jsonl_async(path: Union[Path, str],
+                     data: list[dict[str, Any]],
+                     relaxed: bool = True,
+                     writer: Optional[AsyncWriter] = None) -> Future:
+  """ Dump to jsonl on a background thread.
+
+  See `dump_jsonl` for details. Note that `data` is encoded on the writer
+  thread, so it should not be modified until the returned future completes.
+
+  Args:
+    writer: AsyncWriter to use. Defaults to `default_async_writer()`.
+  """
+  writer = writer or default_async_writer()
+  return writer.submit(dump_jsonl, path, data, relaxed=relaxed)
+
+
+@lru_cache(maxsize=None)
+def _runfiles():
+  """ Returns the process-wide runfiles handle, or None outside of bazel. """
   runfiles = maybe_import('rules_python.python.runfiles.runfiles')
+  return runfiles.Create() if runfiles is not None else None
+
+
+def maybe_rlocation(path: str) -> str:
+  r = _runfiles()
   resolved_path = path
-  if runfiles is not None:
-    r = runfiles.Create()
+  if r is not None:
     resolved_path = r.Rlocation(path)
     if resolved_path is None:
       logging.warning(
@@ -125,6 +2349,35 @@ def maybe_rlocation(path: str) -> str:
   return resolved_path
 
 
+# All bazel prefixes have the same length, so they are dispatched with a single
+# dict lookup on the first `_PREFIX_LEN` characters of a path.
+_PREFIX_LEN = len('bazel::ws://')
+_PATH_PREFIXES = {
+    'bazel::ws://': lambda path, ws, wd: os.path.join(ws or '', path),
+    'bazel::wd://': lambda path, ws, wd: os.path.join(wd or os.getcwd(), path),
+    'bazel::rf://': lambda path, ws, wd: maybe_rlocation(path),
+}
+_PROTOCOL_RE = re.compile(r'^.+://.+$')
+
+
+@lru_cache(maxsize=2**16)
+def _resolve_path(path: str, ws: Optional[str], wd: Optional[str],
+                  cwd: str) -> str:
+  """ Resolves a path given the bazel environment and working directory.
+
+  All inputs which the result depends on are arguments, so results can be
+  memoized.
+  """
+  del cwd  # Only used as part of the cache key.
+  handler = _PATH_PREFIXES.get(path[:_PREFIX_LEN])
+  if handler is not None:
+    path = handler(path[_PREFIX_LEN:], ws, wd)
+  # Check if the path has a protocol, if not then normalize with abspath
+  if not _PROTOCOL_RE.match(path):
+    path = os.path.abspath(path)
+  return path
+
+
 def resolve_path(path: Union[str, Path]) -> str:
   """ Resolves a path, potentially relative to some bazel-specific prefix
 
@@ -145,30 +2398,242 @@ def resolve_path(path: Union[str, Path]) -> str:
 
       All paths not containing a protocol will be normalized using `os.path.
       abspath`.
+
+  Results are memoized for the current environment and working directory.
   """
-  path = str(path)
-  if path.startswith('bazel::ws://'):
-    prefix = os.environ.get('BUILD_WORKSPACE_DIRECTORY', '')
-    path = os.path.join(prefix, re.sub(r'^bazel::ws://', '', path))
-  elif path.startswith('bazel::wd://'):
-    prefix = os.environ.get('BUILD_WORKING_DIRECTORY', os.getcwd())
-    path = os.path.join(prefix, re.sub(r'^bazel::wd://', '', path))
-  elif path.startswith('bazel::rf://'):
-    path = maybe_rlocation(re.sub(r'^bazel::rf://', '', path))
-  # Check if the path has a protocol, if not then normalize with abspath
-  if not re.match(r'^.+://.+$', path):
-    path = os.path.abspath(path)
-  return path
+  return _resolve_path(str(path), os.environ.get('BUILD_WORKSPACE_DIRECTORY'),
+                       os.environ.get('BUILD_WORKING_DIRECTORY'), os.getcwd())
+
+
+def _list_dir(path: str) -> frozenset:
+  try:
+    with os.scandir(path) as it:
+      return frozenset(entry.name for entry in it)
+  except (FileNotFoundError, NotADirectoryError):
+    return frozenset()
+
+
+def resolve_paths(paths: Iterable[Union[str, Path]],
+                  check_exists: bool = False,
+                  num_workers: int = 8) -> List[str]:
+  """ Resolves many paths at once (see `resolve_path`).
+
+  Args:
+    paths: Paths to be resolved.
+    check_exists: Predicate indicating whether to check that all local paths
+      exist. Rather than calling `stat` for each path, each parent directory is
+      listed once, and directories are listed in parallel. Paths with a
+      protocol (e.g. `gs://`) are not checked.
+    num_workers: Number of threads used to list directories.
+
+  Returns:
+    The resolved paths, in the same order as `paths`.
+
+  Raises:
+    FileNotFoundError: If `check_exists` is set and some paths do not exist.
+  """
+  ws = os.environ.get('BUILD_WORKSPACE_DIRECTORY')
+  wd = os.environ.get('BUILD_WORKING_DIRECTORY')
+  cwd = os.getcwd()
+  resolved = [_resolve_path(str(path), ws, wd, cwd) for path in paths]
+  if not check_exists:
+    return resolved
+
+  local = [path for path in resolved if not _PROTOCOL_RE.match(path)]
+  parents = sorted(set(map(os.path.dirname, local)))
+  with ThreadPool(max(1, min(num_workers, len(parents)))) as p:
+    listings = dict(zip(parents, p.map(_list_dir, parents)))
+  missing = [
+      path for path in local if os.path.basename(path) and
+      os.path.basename(path) not in listings[os.path.dirname(path)]
+  ]
+  if missing:
+    raise FileNotFoundError(
+        f'{len(missing)} of {len(resolved)} paths do not exist, e.g. '
+        f'{missing[:5]}.')
+  return resolved
+
+
+# Each downloader thread reuses the connections of its own session, since
+# `requests.Session` is not guaranteed to be thread-safe.
+_download_local = threading.local()
 
 
-def _download_file(
-    task: Tuple[str, str]) -> Union[Tuple[int, str], Tuple[int, None]]:
+def _download_session() -> requests.Session:
+  """ Returns the `requests.Session` of the calling thread. """
+  session = getattr(_download_local, 'session', None)
+  if session is None:
+    session = requests.Session()
+    # A thread only uses one connection at a time, but may alternate between
+    # several hosts.
+    adapter = requests.adapters.HTTPAdapter(pool_connections=16,
+                                            pool_maxsize=1)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    _download_local.session = session
+  return session
+
+
+_CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-\d+/(?:\d+|\*)')
+
+
+def _resume_validator(headers: Mapping[str, str]) -> Optional[str]:
+  """ Returns the validator to send as `If-Range` when resuming, if any. """
+  etag = headers.get('ETag')
+  # Weak entity tags may not be used with `If-Range`.
+  if etag and not etag.startswith('W/'):
+    return etag
+  return headers.get('Last-Modified')
+
+
+def _read_part_meta(meta_path: str, url: str) -> Optional[str]:
+  """ Returns the validator of a partial download of `url`, if any. """
+  try:
+    with open(meta_path, 'rb') as f:
+      meta = json_loads(f.read())
+  except (OSError, ValueError):
+    return None
+  return meta.get('validator') if meta.get('url') == url else None
+
+
+def _write_part_meta(meta_path: str, url: str,
+                     validator: Optional[str]) -> None:
+  """ Records the validator of a partial download, or removes the record. """
+  if validator is None:
+    Path(meta_path).unlink(missing_ok=True)
+  else:
+    with open(meta_path, 'w') as f:
+      f.write(json_dumps({'url': url, 'validator': validator}))
+
+
+def _resume_request(url: str, part_path: str, meta_path: str,
+                    resume: bool) -> Tuple[int, Dict[str, str]]:
+  """ Returns the offset and headers to request the rest of a download. """
+  validator = _read_part_meta(meta_path, url) if resume else None
+  if validator is None or not os.path.isfile(part_path):
+    return 0, {}
+  offset = os.path.getsize(part_path)
+  return offset, {'Range': f'bytes={offset}-', 'If-Range': validator}
+
+
+def _finish_part(part_path: str, fpath: str, meta_path: str) -> None:
+  """ Moves a completed partial download to its final path. """
+  os.replace(part_path, fpath)
+  Path(meta_path).unlink(missing_ok=True)
+
+
+def _discard_part(part_path: str, meta_path: str) -> None:
+  """ Removes a failed partial download, unless it can be resumed. """
+  if not os.path.isfile(meta_path):
+    Path(part_path).unlink(missing_ok=True)
+
+
+def _part_write_mode(url: str, status: int, headers: Mapping[str, str],
+                     offset: int) -> Optional[str]:
+  """ Returns how to write a response to the partial file of a download.
+
+  Returns:
+    `'ab'` to append to the partial file, `'wb'` to write it from the start, or
+    None if the partial file is already complete.
+
+  Raises:
+    ValueError: If the response is an error or does not match the request.
+  """
+  if (status == requests.codes.requested_range_not_satisfiable and
+      headers.get('Content-Range') == f'bytes */{offset}'):
+    return None
+  if status == requests.codes.partial_content:
+    match = _CONTENT_RANGE_RE.match(headers.get('Content-Range', ''))
+    if not match or int(match.group(1)) != offset:
+      raise ValueError(f'Unexpected Content-Range for {url}: '
+                       f'{headers.get("Content-Range")!r}')
+    return 'ab'
+  if status == requests.codes.ok:
+    # Either a new download, or the server ignored the range request.
+    return 'wb'
+  raise ValueError(f'Unexpected status {status} for {url}')
+
+
+def _download_range(task: Tuple[str, int, int, int, str],
+                    chunk_size: int = 2**16) -> None:
+  """ Downloads the byte range `[start, end)` of `url` into `fd` at `start`. """
+  url, fd, start, end, validator = task
+  headers = {'Range': f'bytes={start}-{end - 1}', 'If-Range': validator}
+  with _download_session().get(url, stream=True, headers=headers) as r:
+    match = _CONTENT_RANGE_RE.match(r.headers.get('Content-Range', ''))
+    if (r.status_code != requests.codes.partial_content or not match or
+        int(match.group(1)) != start):
+      # Most likely, the file changed since the download started.
+      raise ValueError(f'Server did not return bytes {start}-{end - 1} of '
+                       f'{url} (status {r.status_code}).')
+    offset = start
+    for data in r.iter_content(chunk_size):
+      view = memoryview(data)
+      while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+  if offset != end:
+    raise ValueError(f'Received {offset - start} of {end - start} bytes for '
+                     f'range {start}-{end - 1} of {url}.')
+
+
+def _download_ranges(url: str,
+                     path: str,
+                     size: int,
+                     validator: str,
+                     num_ranges: int,
+                     chunk_size: int = 2**16) -> None:
+  """ Downloads `url` to `path` as `num_ranges` concurrent range requests. """
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+  try:
+    try:
+      os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+      # Not supported by the platform or file system.
+      os.ftruncate(fd, size)
+    bounds = [size * i // num_ranges for i in range(num_ranges + 1)]
+    tasks = [(url, fd, start, end, validator)
+             for start, end in zip(bounds[:-1], bounds[1:])]
+    with ThreadPool(num_ranges) as p:
+      for _ in p.imap_unordered(
+          partial(_download_range, chunk_size=chunk_size), tasks):
+        pass
+  finally:
+    os.close(fd)
+
+
+def _download_file(task: Tuple[str, str],
+                   chunk_size: int = 2**16,
+                   resume: bool = True,
+                   split_threshold: Optional[int] = None,
+                   num_ranges: int = 8
+                  ) -> Union[Tuple[int, str], Tuple[int, None]]:
   """ Download a single file to a specified path
 
+  The response is streamed to `<filepath>.part`, which is atomically renamed to
+  `filepath` once complete. If the server provides a strong `ETag` or a
+  `Last-Modified` date, they are stored in `<filepath>.part.json` and the
+  partial file is kept when the download fails. A later call then requests only
+  the remaining bytes with a `Range` request, where `If-Range` ensures that the
+  download restarts from scratch if the file has since changed on the server.
+
+  Files of at least `split_threshold` bytes are instead downloaded as
+  `num_ranges` byte ranges over concurrent connections, which are written into
+  a preallocated partial file. This requires the server to support range
+  requests and to provide a validator, which ensures that all ranges are from
+  the same version of the file. Such downloads are not resumable.
+
   Args:
     task: A tuple containing `(url, filepath)`, which specifies where to
       download the file. This function will not create directories, so the
       parent of `filepath` should exist prior to execution.
+    chunk_size: Number of bytes to read from the response at once.
+    resume: Predicate indicating whether to resume from an existing partial
+      download. If `False`, the file is always downloaded from the start.
+    split_threshold: Size in bytes from which to download the file as
+      concurrent byte ranges, or None to always use a single connection.
+    num_ranges: Number of byte ranges to split large files into.
 
   Returns:
     A tuple containing the download status and an error string.
@@ -177,27 +2642,178 @@ def _download_file(
 
   """
   url, fpath = task
-  logging.debug('Downloading %s to %s', url, fpath)
+  part_path = f'{fpath}.part'
+  meta_path = f'{part_path}.json'
+  offset, headers = _resume_request(url, part_path, meta_path, resume)
+  logging.debug('Downloading %s to %s from byte %d', url, fpath, offset)
   try:
-    r = requests.get(url, stream=True)
-    if r.status_code == requests.codes.ok:
-      with open(fpath, 'wb') as f:
-        for data in r:
-          f.write(data)
+    with _download_session().get(url, stream=True, headers=headers) as r:
+      mode = _part_write_mode(url, r.status_code, r.headers, offset)
+      validator = _resume_validator(r.headers)
+      if 'Content-Encoding' in r.headers:
+        # Ranges refer to the encoded data, whereas the decoded data is written.
+        validator = None
+      size = int(r.headers.get('Content-Length', -1))
+      if (mode == 'wb' and split_threshold is not None and
+          size >= split_threshold and validator is not None and
+          r.headers.get('Accept-Ranges') == 'bytes'):
+        # Drops the connection rather than reading the full response.
+        r.close()
+        _write_part_meta(meta_path, url, None)
+        _download_ranges(url, part_path, size, validator, num_ranges,
+                         chunk_size)
+      elif mode is not None:
+        if mode == 'wb':
+          _write_part_meta(meta_path, url, validator)
+        with open(part_path, mode) as f:
+          for data in r.iter_content(chunk_size):
+            f.write(data)
+    _finish_part(part_path, fpath, meta_path)
   except:
     logging.exception('Failed to download %s', url)
-    # cleanup
-    Path(fpath).unlink(missing_ok=True)
+    _discard_part(part_path, meta_path)
+    return 0, 'error -failed to dl or write'
+  return 1, None
+
+
+# Minimum number of bytes per write of the asyncio backend.
+_ASYNC_WRITE_SIZE = 2**20
+
+
+def _open_part(part_path: str, mode: str, meta_path: str, url: str,
+               validator: Optional[str]) -> io.BufferedWriter:
+  """ Opens the partial file of a download, recording its validator. """
+  if mode == 'wb':
+    _write_part_meta(meta_path, url, validator)
+  return open(part_path, mode)
+
+
+def _close_part(f: io.BufferedWriter, pending: List[bytes]) -> None:
+  """ Writes the remaining chunks of a download and closes its file. """
+  with f:
+    f.writelines(pending)
+
+
+async def _download_file_aiohttp(session: aiohttp.ClientSession,
+                                  task: Tuple[str, str],
+                                  chunk_size: int = 2**16,
+                                  resume: bool = True
+                                 ) -> Union[Tuple[int, str], Tuple[int, None]]:
+  """ Like `_download_file`, but using an `aiohttp.ClientSession`.
+
+  File operations run on the default executor of the event loop, so that slow
+  disks do not hold up other downloads. Large files are not split into byte
+  ranges.
+  """
+  url, fpath = task
+  part_path = f'{fpath}.part'
+  meta_path = f'{part_path}.json'
+  run = partial(asyncio.get_running_loop().run_in_executor, None)
+  offset, headers = await run(_resume_request, url, part_path, meta_path,
+                              resume)
+  logging.debug('Downloading %s to %s from byte %d', url, fpath, offset)
+  try:
+    async with session.get(url, headers=headers) as r:
+      mode = _part_write_mode(url, r.status, r.headers, offset)
+      validator = _resume_validator(r.headers)
+      if 'Content-Encoding' in r.headers:
+        # aiohttp decodes the response, see `_download_file`.
+        validator = None
+      if mode is not None:
+        f = await run(_open_part, part_path, mode, meta_path, url, validator)
+        try:
+          # Writes are batched to limit the round trips to the executor.
+          pending, num_pending = [], 0
+          async for data in r.content.iter_chunked(chunk_size):
+            pending.append(data)
+            num_pending += len(data)
+            if num_pending >= _ASYNC_WRITE_SIZE:
+              await run(f.writelines, pending)
+              pending, num_pending = [], 0
+        finally:
+          await run(_close_part, f, pending)
+    await run(_finish_part, part_path, fpath, meta_path)
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('Failed to download %s', url)
+    await run(_discard_part, part_path, meta_path)
     return 0, 'error -failed to dl or write'
   return 1, None
 
 
+async def _download_files_async(
+    tasks: List[Tuple[str, str]],
+    max_concurrency: int,
+    max_per_host: Optional[int] = None,
+    chunk_size: int = 2**16,
+    resume: bool = True) -> List[Union[Tuple[int, str], Tuple[int, None]]]:
+  """ Downloads `(url, filepath)` tasks concurrently on the event loop.
+
+  Uses `aiohttp` if installed, and otherwise runs `_download_file` on a pool of
+  `max_concurrency` threads.
+
+  Returns:
+    The `(status, errmsg)` result of each task, in order.
+  """
+  limit = asyncio.Semaphore(max_concurrency)
+  host_limits = {}
+
+  async def run(download, task):
+    host = urllib.parse.urlsplit(task[0]).netloc
+    if host not in host_limits:
+      host_limits[host] = asyncio.Semaphore(max_per_host or max_concurrency)
+    # Waits for the host first, so that tasks for busy hosts do not hold back
+    # tasks for other hosts.
+    async with host_limits[host], limit:
+      return await download(task)
+
+  if aiohttp is not None:
+    connector = aiohttp.TCPConnector(limit=max_concurrency,
+                                     limit_per_host=max_per_host or 0)
+    # As with `requests`, downloads may take arbitrarily long.
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=timeout) as session:
+      download = partial(_download_file_aiohttp,
+                         session,
+                         chunk_size=chunk_size,
+                         resume=resume)
+      return await asyncio.gather(*[run(download, task) for task in tasks])
+
+  loop = asyncio.get_running_loop()
+  with ThreadPoolExecutor(max_concurrency) as executor:
+    download = lambda task: loop.run_in_executor(
+        executor,
+        partial(_download_file, task, chunk_size=chunk_size, resume=resume))
+    return await asyncio.gather(*[run(download, task) for task in tasks])
+
+
+def _run_coroutine(coro: Coroutine[Any, Any, Any]) -> Any:
+  """ Runs `coro` to completion, even if an event loop is already running.
+
+  e.g. in jupyter notebooks, where the running loop can't be blocked on. The
+  coroutine then runs on a new event loop in a helper thread.
+  """
+  try:
+    asyncio.get_running_loop()
+  except RuntimeError:
+    return asyncio.run(coro)
+  with ThreadPoolExecutor(1) as executor:
+    return executor.submit(asyncio.run, coro).result()
+
+
 def download_files(tasks: List[Dict[str, Any]],
                    download_dir: Optional[Union[str, Path]] = None,
                    num_threads: Optional[int] = None,
                    clobber: bool = False,
                    filename_key: str = 'filename',
-                   url_key: str = 'url') -> int:
+                   url_key: str = 'url',
+                   chunk_size: int = 2**16,
+                   resume: bool = True,
+                   split_threshold: Optional[int] = 2**28,
+                   num_ranges: int = 8,
+                   backend: str = 'threads',
+                   max_concurrency: int = 64,
+                   max_per_host: Optional[int] = None) -> int:
   """ Download a list of files, optionally overwriting existing files.
 
   Args:
@@ -206,16 +2822,40 @@ def download_files(tasks: List[Dict[str, Any]],
     download_dir: Directory to download results, if provided.
     num_threads: Number of downloader threads to use. Defaults to the number of
       supported threads (as reported by `multiprocessing.cpu_count()`).
-    clobber: Predicate indicating that existing files should be deleted. The
-      default of `False` means that existing files will be skipped.
+    clobber: Predicate indicating that existing files should be replaced once
+      downloaded again. The default of `False` means that existing files will
+      be skipped.
     filename_key: Key to use as the filename in `tasks`
     url_key: Key to use as the url in `tasks`
+    chunk_size: Number of bytes to read from each response at once.
+    resume: Predicate indicating whether to resume partial downloads left by a
+      previous call (as `<filename>.part`) with HTTP range requests.
+    split_threshold: Size in bytes from which to download a single file as
+      `num_ranges` concurrent byte ranges, or None to disable splitting.
+    num_ranges: Number of byte ranges to split large files into. Note that each
+      downloader thread may use up to `num_ranges` connections.
+    backend: Either `'threads'` to download with a pool of `num_threads`
+      threads, or `'asyncio'` to run up to `max_concurrency` downloads on an
+      event loop. The latter uses `aiohttp` if installed, and otherwise runs
+      each download on a thread of its own pool. Large files are only split
+      into byte ranges by the `'threads'` backend.
+    max_concurrency: Maximum number of concurrent downloads for the `'asyncio'`
+      backend.
+    max_per_host: Maximum number of concurrent downloads from the same host for
+      the `'asyncio'` backend, or None for no limit.
+
+  Connections are kept alive and reused for all files downloaded by the same
+  thread. Files are written to `<filename>.part` and only renamed to
+  `filename` once complete, so interrupted downloads are never mistaken for
+  existing files.
 
   Returns:
     The number of files successfully downloaded. Note that this does not
     include files which were skipped or failed to download.
 
   """
+  if backend not in ('threads', 'asyncio'):
+    raise ValueError(f'Unknown backend: {backend!r}')
   og_n_tasks = len(tasks)
 
   if download_dir:
@@ -228,25 +2868,41 @@ def download_files(tasks: List[Dict[str, Any]],
   # Maybe filter
   if not clobber:
     tasks = T.filter(lambda task: not task[filename_key].is_file(), tasks)
-    tasks = list(tasks)
-    n_skipped = og_n_tasks - len(tasks)
-    if n_skipped:
-      logging.info('Skipping %d existing files.', n_skipped)
-
-  num_threads = num_threads or mp.cpu_count()
-  logging.info('Downloading %d files w/ %d threads', len(tasks), num_threads)
+  tasks = list(tasks)
+  n_skipped = og_n_tasks - len(tasks)
+  if n_skipped:
+    logging.info('Skipping %d existing files.', n_skipped)
 
   num_tasks = len(tasks)
   # Map -> List[Tuple[url, filename]]
-  tasks = map(T.get([url_key, filename_key]), tasks)
+  tasks = list(map(T.get([url_key, filename_key]), tasks))
+
+  if backend == 'asyncio':
+    logging.info('Downloading %d files w/ up to %d concurrent requests',
+                 num_tasks, max_concurrency)
+    results = _run_coroutine(
+        _download_files_async(tasks,
+                              max_concurrency,
+                              max_per_host=max_per_host,
+                              chunk_size=chunk_size,
+                              resume=resume))
+  else:
+    num_threads = num_threads or mp.cpu_count()
+    logging.info('Downloading %d files w/ %d threads', num_tasks, num_threads)
+    with ThreadPool(num_threads) as p:
+      results = p.map(partial(_download_file,
+                              chunk_size=chunk_size,
+                              resume=resume,
+                              split_threshold=split_threshold,
+                              num_ranges=num_ranges),
+                      tasks,
+                      chunksize=1)
 
   num_completed = 0
-  with ThreadPool(num_threads) as p:
-    results = p.imap_unordered(_download_file, tasks)
-    for s, r in results:
-      if r:
-        logging.error('download %s', r)
-      num_completed += s
+  for s, r in results:
+    if r:
+      logging.error('download %s', r)
+    num_completed += s
 
   logging.info('Successfully downloaded %d/%d files.', num_completed, num_tasks)
   return num_completed
@@ -14,16 +14,62 @@
 # ==============================================================================
 """ Provides tests for `labtools._src.io_util` """
 
+import asyncio
+import copy
+import gc
+import gzip
+import json
+import math
+import multiprocessing as mp
 import os
+import pickle
+import sys
+from pathlib import Path
+import threading
+import time
+from unittest import mock
 
 from absl.testing import absltest
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 from absl.testing import parameterized
 from fsspec.registry import known_implementations
 
+from labtools._src import io_util
 from labtools._src.io_util import _download_file
+from labtools._src.io_util import AsyncWriter
 from labtools._src.io_util import download_files
+from labtools._src.io_util import dump_json
+from labtools._src.io_util import dump_jsonl_sharded
+from labtools._src.io_util import load_json
+from labtools._src.io_util import dump_json_async
 from labtools._src.io_util import dump_jsonl
+from labtools._src.io_util import dump_jsonl_async
+from labtools._src.io_util import JsonlFile
+from labtools._src.io_util import JsonlWriter
+from labtools._src.io_util import LazyRecord
+from labtools._src.io_util import disable_load_cache
+from labtools._src.io_util import enable_load_cache
+from labtools._src.io_util import load_and_check_yml
+from labtools._src.io_util import load_and_check_ymls
+from labtools._src.io_util import load_cache_info
+from labtools._src.io_util import load_jsonl
+from labtools._src.io_util import load_jsonl_arrow
+from labtools._src.io_util import load_jsonl_columns
+from labtools._src.io_util import load_jsonl_df
+from labtools._src.io_util import load_jsonl_sharded
+from labtools._src.io_util import load_jsonl_shuffled
+from labtools._src.io_util import list_jsonl_shards
 from labtools._src.io_util import resolve_path
+from labtools._src.io_util import resolve_paths
+from labtools._src.io_util import SharedJsonlDataset
+from labtools._src.profiling import profiler
+from labtools._src.testing._http_server import LocalHTTPServer
+
+
+def _idx_lt_3(record):
+  return record['idx'] < 3
 
 
 class JsonlTest(parameterized.TestCase):
@@ -32,6 +78,729 @@ class JsonlTest(parameterized.TestCase):
     data = [{'a': 0}, {'b': 1}, {'me': 'the'}]
     dump_jsonl(self.create_tempfile(), data)
 
+  @parameterized.named_parameters(
+      ('serial', {}),
+      ('parallel', {'num_workers': 2}),
+      ('memory_map', {'memory_map': True}),
+  )
+  def test_load_jsonl_big_int(self, kwargs):
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, [{'id': 2**64 + 1}] * 3)
+    res = [dict(r) for r in load_jsonl(path, **kwargs)]
+    self.assertEqual(res, [{'id': 2**64 + 1}] * 3)
+    self.assertIs(type(res[0]['id']), int)
+    dump_json(path, {'id': 2**64 + 1})
+    self.assertIs(type(load_json(path, cache=False)['id']), int)
+
+  @parameterized.named_parameters(
+      ('serial', {}),
+      ('parallel', {'num_workers': 2}),
+      ('memory_map', {'memory_map': True}),
+      ('where', {'where': {'a': 2}}),
+      ('where_memory_map', {'where': {'a': 2}, 'memory_map': True}),
+  )
+  def test_load_jsonl_blank_lines(self, kwargs):
+    path = self.create_tempfile(
+        content='\n{"a": 1}\n\n  \t\r\n{"a": 2}\n\n').full_path
+    res = [dict(r) for r in load_jsonl(path, **kwargs)]
+    expected = [{'a': 1}, {'a': 2}]
+    self.assertEqual(res, expected[1:] if 'where' in kwargs else expected)
+
+  def test_dump_jsonl_nan(self):
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, [{'loss': float('nan'), 'acc': float('inf')}])
+    res = list(load_jsonl(path))
+    self.assertTrue(math.isnan(res[0]['loss']))
+    self.assertEqual(res[0]['acc'], float('inf'))
+
+  @parameterized.parameters(True, False)
+  def test_load_jsonl_parallel(self, ordered):
+    data = [{'idx': i, 'text': 'x' * (i % 7)} for i in range(1000)]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data)
+    res = list(
+        load_jsonl(path, num_workers=2, chunk_size=512, ordered=ordered))
+    if not ordered:
+      res = sorted(res, key=lambda x: x['idx'])
+    self.assertEqual(res, data)
+
+  @parameterized.parameters(True, False)
+  def test_dump_jsonl_parallel(self, write_index):
+    data = [{'idx': i, 'text': 'é' * (i % 7), 'path': Path(str(i))}
+            for i in range(1000)]
+    td = self.create_tempdir().full_path
+    serial, parallel = os.path.join(td, 'serial'), os.path.join(td, 'parallel')
+    dump_jsonl(serial, data, write_index=write_index)
+    dump_jsonl(parallel, data, write_index=write_index, num_workers=2,
+               chunk_size=64)
+    for suffix in ['', '.idx'] if write_index else ['']:
+      with open(serial + suffix, 'rb') as f1, open(parallel + suffix,
+                                                  'rb') as f2:
+        self.assertEqual(f1.read(), f2.read())
+
+  def test_dump_jsonl_parallel_strict(self):
+    data = [{'a': object()}]
+    with self.assertRaises(TypeError):
+      dump_jsonl(self.create_tempfile(), data, relaxed=False, num_workers=2)
+
+  @parameterized.parameters('data.jsonl', 'data.jsonl.gz')
+  def test_dataframe_roundtrip(self, name):
+    df = pd.DataFrame({
+        'i': np.arange(1000),
+        'f': np.linspace(0, 1, 1000),
+        's': [f'x{i}' for i in range(1000)],
+    })
+    path = os.path.join(self.create_tempdir().full_path, name)
+    dump_jsonl(path, df, chunk_size=128)
+    self.assertLen(list(load_jsonl(path)), 1000)
+    res = load_jsonl_df(path, chunk_size=100)
+    pd.testing.assert_frame_equal(res, df, check_dtype=False)
+    self.assertEqual(res['i'].dtype, np.int64)
+    res = load_jsonl_df(path, columns=['s', 'i'])
+    self.assertEqual(list(res.columns), ['s', 'i'])
+
+  def test_load_jsonl_memory_map(self):
+    data = [{'idx': i, 'nested': {'x': [i]}} for i in range(10)]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data)
+    res = list(load_jsonl(path, memory_map=True))
+    self.assertLen(res, 10)
+    self.assertIsInstance(res[0], LazyRecord)
+    self.assertIsInstance(res[0].raw, memoryview)
+    self.assertEqual(res[3]['nested'], {'x': [3]})
+    self.assertEqual(list(map(dict, res)), data)
+
+  def test_load_jsonl_memory_map_empty(self):
+    path = self.create_tempfile().full_path
+    self.assertEqual(list(load_jsonl(path, memory_map=True)), [])
+
+  def test_load_jsonl_columns(self):
+    data = [
+        {'i': 0, 'f': 0.5, 'b': True, 's': 'a', 'm': 1},
+        {'i': 1, 'f': 1, 'b': False, 's': 'b'},
+        {'i': 2, 'f': 2.5, 'b': True, 's': 'c', 'm': None, 'late': 2**64 + 1},
+    ]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data)
+    res = load_jsonl_columns(path)
+    self.assertEqual(set(res), {'i', 'f', 'b', 's', 'm', 'late'})
+    np.testing.assert_array_equal(res['i'], [0, 1, 2])
+    self.assertEqual(res['i'].dtype, np.int64)
+    np.testing.assert_array_equal(res['f'], [0.5, 1.0, 2.5])
+    self.assertEqual(res['f'].dtype, np.float64)
+    self.assertEqual(res['b'].dtype, np.bool_)
+    self.assertEqual(res['s'].dtype, object)
+    self.assertEqual(res['s'].tolist(), ['a', 'b', 'c'])
+    self.assertIsInstance(res['m'], np.ma.MaskedArray)
+    self.assertEqual(res['m'].mask.tolist(), [False, True, True])
+    # integers beyond int64 are kept exactly, as objects.
+    self.assertEqual(res['late'].tolist(), [None, None, 2**64 + 1])
+    self.assertIs(type(res['late'][2]), int)
+
+  def test_load_jsonl_columns_projection(self):
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, [{'a': 1, 'b': 2}, {'a': 3, 'b': 4}])
+    res = load_jsonl_columns(path, columns=['a', 'missing'])
+    self.assertEqual(set(res), {'a', 'missing'})
+    np.testing.assert_array_equal(res['a'], [1, 3])
+    self.assertTrue(res['missing'].mask.all())
+
+  @parameterized.named_parameters(
+      ('serial', {}),
+      ('parallel', {'num_workers': 2, 'chunk_size': 256}),
+      ('gzip', {}, 'data.jsonl.gz'),
+  )
+  def test_load_jsonl_pushdown(self, kwargs, name='data.jsonl'):
+    data = [{'idx': i, 'split': ['train', 'test'][i % 2], 'ok': i % 3 == 0,
+             'text': 'x' * i} for i in range(100)]
+    path = os.path.join(self.create_tempdir().full_path, name)
+    dump_jsonl(path, data)
+    res = list(load_jsonl(path, columns=['idx', 'missing'],
+                          where={'split': 'test', 'ok': True}, **kwargs))
+    self.assertEqual(res, [{'idx': i} for i in range(100) if i % 6 == 3])
+    res = list(load_jsonl(path, where=_idx_lt_3, **kwargs))
+    self.assertEqual(res, data[:3])
+
+  def test_load_jsonl_pushdown_unsafe_values(self):
+    # values which are not prefiltered are still matched exactly.
+    data = [{'s': 'a/b "c"', 'f': 0.5}, {'s': 'a/b', 'f': 0.5}]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data)
+    res = list(load_jsonl(path, where={'s': 'a/b "c"', 'f': 0.5}))
+    self.assertEqual(res, data[:1])
+
+  @parameterized.parameters(
+      (1, [1]),
+      (True, [True]),
+      (1.0, [1, 1.0]),
+  )
+  def test_load_jsonl_pushdown_types(self, value, expected):
+    # booleans and integers only match values of the same type, whether or not
+    # lines are prefiltered.
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, [{'a': 1}, {'a': 1.0}, {'a': True}])
+    res = list(load_jsonl(path, where={'a': value}))
+    self.assertEqual([r['a'] for r in res], expected)
+    self.assertEqual([type(r['a']) for r in res], list(map(type, expected)))
+
+  def test_load_jsonl_pushdown_memory_map(self):
+    data = [{'idx': i, 'split': ['train', 'test'][i % 2]} for i in range(10)]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data)
+    res = list(load_jsonl(path, memory_map=True, where={'split': 'train'}))
+    self.assertIsInstance(res[0], LazyRecord)
+    self.assertEqual(list(map(dict, res)), data[::2])
+    with self.assertRaises(ValueError):
+      list(load_jsonl(path, memory_map=True, columns=['idx']))
+
+
+class ArrowCacheTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.cache_dir = self.create_tempdir().full_path
+    self.path = os.path.join(self.create_tempdir().full_path, 'data.jsonl')
+    dump_jsonl(self.path, [{'i': i, 's': f'x{i}'} for i in range(100)])
+
+  def cached_entries(self):
+    return sorted(f for f in os.listdir(self.cache_dir) if f[0] != '.')
+
+  @parameterized.parameters('arrow', 'parquet')
+  def test_load_jsonl_arrow(self, cache_format):
+    for _ in range(2):
+      table = load_jsonl_arrow(self.path, cache_dir=self.cache_dir,
+                               cache_format=cache_format)
+      self.assertEqual(table.num_rows, 100)
+      self.assertEqual(table.column('i').to_pylist(), list(range(100)))
+      self.assertLen(self.cached_entries(), 1)
+    table = load_jsonl_arrow(self.path, columns=['s'], cache_dir=self.cache_dir,
+                             cache_format=cache_format)
+    self.assertEqual(table.column_names, ['s'])
+
+  @parameterized.parameters('stat', 'content')
+  def test_invalidate(self, fingerprint):
+    load_jsonl_arrow(self.path, cache_dir=self.cache_dir,
+                     fingerprint=fingerprint)
+    (entry,) = self.cached_entries()
+    dump_jsonl(self.path, [{'i': -1}])
+    table = load_jsonl_arrow(self.path, cache_dir=self.cache_dir,
+                             fingerprint=fingerprint)
+    self.assertEqual(table.to_pylist(), [{'i': -1}])
+    self.assertNotIn(entry, self.cached_entries())
+    self.assertLen(self.cached_entries(), 1)
+
+  def test_mixed_types(self):
+    dump_jsonl(self.path, [{'a': 1}, {'a': 'x'}])
+    with self.assertRaises(pa.ArrowInvalid):
+      load_jsonl_arrow(self.path, cache_dir=self.cache_dir)
+
+  def test_evict(self):
+    paths, entries = [], []
+    for i in range(4):
+      paths.append(os.path.join(self.create_tempdir().full_path, 'f.jsonl'))
+      dump_jsonl(paths[-1], [{'i': i}])
+    for path in paths[:3]:
+      load_jsonl_arrow(path, cache_dir=self.cache_dir)
+      (entry,) = set(self.cached_entries()) - set(entries)
+      entries.append(entry)
+      time.sleep(0.01)
+    # a hit marks the first entry as used, so the second is evicted.
+    load_jsonl_arrow(paths[0], cache_dir=self.cache_dir)
+    size = os.path.getsize(os.path.join(self.cache_dir, entries[0]))
+    load_jsonl_arrow(paths[3], cache_dir=self.cache_dir,
+                     max_cache_bytes=3 * size)
+    self.assertLen(self.cached_entries(), 3)
+    self.assertNotIn(entries[1], self.cached_entries())
+    self.assertIn(entries[0], self.cached_entries())
+
+
+class YmlTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.paths = []
+    for i in range(4):
+      self.paths.append(self.create_tempfile(
+          f'{i}.yml', f'model:\n  name: m{i}\n  layers: [1, 2]\nseed: {i}\n'
+      ).full_path)
+
+  def test_load_and_check_yml(self):
+    self.assertEqual(
+        load_and_check_yml(self.paths[1], 'model/name', 'seed', 'missing/key'),
+        ['m1', 1, None])
+
+  @parameterized.parameters(None, 2)
+  def test_load_and_check_ymls(self, num_workers):
+    res = load_and_check_ymls(self.paths, 'model/name', 'model/layers',
+                              num_workers=num_workers)
+    self.assertEqual(res, [[f'm{i}', [1, 2]] for i in range(4)])
+
+  @parameterized.parameters(None, 2)
+  def test_load_and_check_ymls_cached(self, num_workers):
+    enable_load_cache()
+    self.addCleanup(disable_load_cache)
+    load_and_check_yml(self.paths[0], 'seed')
+    res = load_and_check_ymls(self.paths, 'seed', num_workers=num_workers)
+    self.assertEqual(res, [[i] for i in range(4)])
+    self.assertEqual(load_cache_info()[:2], (1, 4))
+    res = load_and_check_ymls(self.paths, 'seed', num_workers=num_workers)
+    self.assertEqual(res, [[i] for i in range(4)])
+    self.assertEqual(load_cache_info()[:2], (5, 4))
+
+
+class LoadCacheTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    enable_load_cache(2**20)
+    self.addCleanup(disable_load_cache)
+    self.path = self.create_tempfile().full_path
+
+  def test_load_json(self):
+    dump_json(self.path, {'a': [1, {'b': 2}]})
+    first = load_json(self.path)
+    self.assertIs(load_json(self.path), first)
+    self.assertEqual(load_cache_info()[:2], (1, 1))
+    self.assertEqual(first, {'a': [1, {'b': 2}]})
+    # writing to the file invalidates the cached object.
+    dump_json(self.path, {'a': [1, {'b': 3}, 4]})
+    self.assertEqual(load_json(self.path), {'a': [1, {'b': 3}, 4]})
+    self.assertEqual(load_cache_info()[:2], (1, 2))
+    # and uncached calls do not change the stats.
+    self.assertIsNot(load_json(self.path, cache=False), first)
+    self.assertEqual(load_cache_info()[:2], (1, 2))
+
+  def test_read_only(self):
+    dump_json(self.path, {'a': [1, {'b': 2}], 'x': np.arange(3)},
+              arrays_threshold=0)
+    obj = load_json(self.path, restore_arrays=True)
+    with self.assertRaises(TypeError):
+      obj['c'] = 1
+    with self.assertRaises(TypeError):
+      obj['a'].append(1)
+    with self.assertRaises(TypeError):
+      obj['a'][1].update(b=3)
+    with self.assertRaises(ValueError):
+      obj['x'][0] = 1
+    for copied in [copy.deepcopy(obj), pickle.loads(pickle.dumps(obj))]:
+      copied['a'][1]['b'] = 3
+      copied['x'][0] = 1
+      self.assertEqual(type(copied['a']), list)
+    self.assertEqual(obj['a'][1]['b'], 2)
+    self.assertEqual(obj['x'][0], 0)
+    self.assertEqual(json.loads(json.dumps(obj['a'])), [1, {'b': 2}])
+
+  def test_load_jsonl(self):
+    data = [{'idx': i} for i in range(10)]
+    dump_jsonl(self.path, data)
+    self.assertEqual(list(load_jsonl(self.path)), data)
+    self.assertEqual(list(load_jsonl(self.path)), data)
+    self.assertEqual(list(load_jsonl(self.path, where={'idx': 1})), data[1:2])
+    self.assertEqual(load_cache_info()[:2], (1, 1))
+
+  def test_load_and_check_yml(self):
+    with open(self.path, 'w', encoding='utf-8') as f:
+      f.write('a:\n  b: 1\nc: 2\n')
+    self.assertEqual(load_and_check_yml(self.path, 'a/b', 'c'), [1, 2])
+    self.assertEqual(load_and_check_yml(self.path, 'c', 'd'), [2, None])
+    self.assertEqual(load_cache_info()[:2], (1, 1))
+
+  def test_evict(self):
+    paths = [self.create_tempfile().full_path for _ in range(3)]
+    for i, path in enumerate(paths):
+      dump_json(path, {'data': 'x' * 40, 'i': i})
+    max_bytes = 5 * os.path.getsize(paths[0]) // 2
+    enable_load_cache(max_bytes)
+    for path in paths:
+      load_json(path)
+    info = load_cache_info()
+    self.assertEqual((info.entries, info.evictions), (2, 1))
+    self.assertLessEqual(info.size_bytes, max_bytes)
+    load_json(paths[0])
+    self.assertEqual(load_cache_info().misses, 4)
+
+
+def _shared_dataset_sum(task):
+  ds, idx = task
+  return sum(ds[idx]['values'])
+
+
+class SharedJsonlDatasetTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.data = [{'idx': i, 'values': list(range(i)), 'text': 'é' * i}
+                 for i in range(50)]
+    self.path = self.create_tempfile().full_path
+    dump_jsonl(self.path, self.data)
+
+  def test_from_jsonl(self):
+    with SharedJsonlDataset.from_jsonl(self.path) as ds:
+      self.assertLen(ds, 50)
+      self.assertIsInstance(ds[0], LazyRecord)
+      self.assertEqual(ds[-1]['text'], 'é' * 49)
+      self.assertEqual([dict(x) for x in ds[10:12]], self.data[10:12])
+      self.assertEqual(list(map(dict, ds)), self.data)
+      with self.assertRaises(IndexError):
+        ds[50]  # pylint: disable=pointless-statement
+
+  def test_attach(self):
+    with SharedJsonlDataset.from_jsonl(self.path, columns=['idx']) as ds:
+      other = pickle.loads(pickle.dumps(ds))
+      self.assertEqual(other.name, ds.name)
+      self.assertEqual(dict(other[3]), {'idx': 3})
+      other.close()
+
+  @parameterized.parameters('fork', 'spawn')
+  def test_workers(self, start_method):
+    with SharedJsonlDataset.from_jsonl(self.path) as ds:
+      with mp.get_context(start_method).Pool(2) as p:
+        res = p.map(_shared_dataset_sum, [(ds, i) for i in range(len(ds))])
+        # shutdown cleanly, exiting the context manager terminates the workers.
+        p.close()
+        p.join()
+      self.assertEqual(res, [sum(range(i)) for i in range(50)])
+
+  def test_records_outlive_dataset(self):
+    with SharedJsonlDataset.from_jsonl(self.path) as ds:
+      record = ds[1]
+    # the segment is freed, but stays mapped while the record is alive.
+    self.assertFalse(os.path.exists(os.path.join('/dev/shm', ds.name)))
+    self.assertEqual(dict(record), self.data[1])
+    with mock.patch.object(sys, 'unraisablehook') as hook:
+      del ds, record
+      gc.collect()
+    hook.assert_not_called()
+
+  def test_empty(self):
+    path = self.create_tempfile().full_path
+    with SharedJsonlDataset.from_jsonl(path) as ds:
+      self.assertEmpty(ds)
+
+
+class ArraySidecarTest(parameterized.TestCase):
+
+  @parameterized.parameters(True, False)
+  def test_json(self, memory_map):
+    data = {'big': np.arange(64).reshape(8, 8), 'small': np.ones(2), 'a': 1}
+    path = self.create_tempdir().full_path + '/data.json'
+    dump_json(path, data, arrays_threshold=64)
+    self.assertTrue(os.path.isfile(path + '.arrays'))
+    res = load_json(path, restore_arrays=True, memory_map_arrays=memory_map)
+    np.testing.assert_array_equal(res['big'], data['big'])
+    self.assertEqual(res['big'].dtype, data['big'].dtype)
+    self.assertEqual(res['small'], [1.0, 1.0])
+    self.assertEqual(res['a'], 1)
+    if memory_map:
+      self.assertIsInstance(res['big'].base, np.memmap)
+    # references are returned as-is by default, as with `load_jsonl`.
+    ref = load_json(path)['big']['__ndarray__']
+    self.assertEqual(ref['shape'], [8, 8])
+
+  @parameterized.parameters('datetime64[s]', 'timedelta64[ms]', bool)
+  def test_dtypes(self, dtype):
+    # e.g. datetime64 arrays can't be exported as a buffer.
+    data = {'t': np.arange(100).astype(dtype)}
+    path = self.create_tempdir().full_path + '/data.json'
+    dump_json(path, data, arrays_threshold=8)
+    res = load_json(path, restore_arrays=True)
+    self.assertEqual(res['t'].dtype, data['t'].dtype)
+    np.testing.assert_array_equal(res['t'], data['t'])
+
+  def test_jsonl(self):
+    data = [{'idx': i, 'emb': np.full((3, 5), i, dtype=np.float32)}
+            for i in range(10)]
+    path = self.create_tempdir().full_path + '/data.jsonl'
+    dump_jsonl(path, data, arrays_threshold=0)
+    for res, expected in zip(load_jsonl(path, restore_arrays=True), data):
+      self.assertEqual(res['idx'], expected['idx'])
+      np.testing.assert_array_equal(res['emb'], expected['emb'])
+    self.assertLen(list(load_jsonl(path, restore_arrays=True)), 10)
+
+  def test_closed_on_error(self):
+    path = self.create_tempdir().full_path + '/data.jsonl'
+    close = self.enter_context(
+        mock.patch.object(io_util._ArraySidecarWriter, 'close', autospec=True,
+                          side_effect=io_util._ArraySidecarWriter.close))
+    data = [{'emb': np.ones(8)}, {'emb': np.ones(8), 'bad': object()}]
+    with self.assertRaises(TypeError):
+      dump_jsonl(path, data, relaxed=False, arrays_threshold=0)
+    close.assert_called_once()
+    with mock.patch.object(io_util._ArraySidecarWriter, '_write',
+                           side_effect=OSError('No space left on device')):
+      with self.assertRaises(OSError):
+        dump_json(path, data[0], arrays_threshold=0)
+    self.assertEqual(close.call_count, 2)
+
+
+class CompressionTest(parameterized.TestCase):
+
+  @parameterized.parameters('.gz', '.zst', '.lz4')
+  def test_jsonl_roundtrip(self, suffix):
+    data = [{'idx': i, 'text': 'abc' * i} for i in range(100)]
+    path = self.create_tempdir().full_path + '/data.jsonl' + suffix
+    dump_jsonl(path, data)
+    with open(path, 'rb') as f:
+      self.assertNotEqual(f.read(1), b'{')
+    self.assertEqual(list(load_jsonl(path)), data)
+
+  def test_explicit_compression(self):
+    data = [{'a': 1}]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data, compression='gzip')
+    with gzip.open(path, 'rt') as f:
+      self.assertEqual(json.loads(f.read()), data[0])
+    # detected from the file contents.
+    self.assertEqual(list(load_jsonl(path)), data)
+
+  def test_dump_json(self):
+    path = self.create_tempdir().full_path + '/data.json.gz'
+    dump_json(path, {'a': [1, 2]})
+    with gzip.open(path, 'rt') as f:
+      self.assertEqual(json.load(f), {'a': [1, 2]})
+
+  def test_writer(self):
+    data = [{'idx': i} for i in range(100)]
+    path = self.create_tempdir().full_path + '/data.jsonl.gz'
+    with JsonlWriter(path, max_shard_bytes=500, fsync=True) as writer:
+      writer.write_many(data)
+    self.assertEqual(writer.paths[0].name, 'data-00000.jsonl.gz')
+    self.assertEqual([x for p in writer.paths for x in load_jsonl(p)], data)
+
+  def test_unsupported_modes(self):
+    path = self.create_tempdir().full_path + '/data.jsonl.gz'
+    dump_jsonl(path, [{'a': 1}])
+    with self.assertRaises(ValueError):
+      list(load_jsonl(path, memory_map=True))
+    with self.assertRaises(ValueError):
+      JsonlFile(path)
+    with self.assertRaises(ValueError):
+      dump_jsonl(path, [{'a': 1}], write_index=True)
+
+
+class JsonlFileTest(parameterized.TestCase):
+
+  @parameterized.parameters(True, False)
+  def test_random_access(self, write_index):
+    data = [{'idx': i, 'text': 'é' * (i % 5)} for i in range(50)]
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, data, write_index=write_index)
+    self.assertEqual(os.path.isfile(path + '.idx'), write_index)
+    with JsonlFile(path) as f:
+      self.assertLen(f, 50)
+      self.assertEqual(f[3], data[3])
+      self.assertEqual(f[-1], data[-1])
+      self.assertEqual(f[10:20:3], data[10:20:3])
+      self.assertEqual(list(f), data)
+      self.assertLen(f.sample(5, seed=0), 5)
+      with self.assertRaises(IndexError):
+        f[50]  # pylint: disable=pointless-statement
+    self.assertTrue(os.path.isfile(path + '.idx'))
+
+  def test_stale_index(self):
+    path = self.create_tempfile().full_path
+    dump_jsonl(path, [{'a': 1}], write_index=True)
+    with open(path, 'a', encoding='utf-8') as f:
+      f.write('{"a": 2}\n')
+    with JsonlFile(path) as f:
+      self.assertEqual(list(f), [{'a': 1}, {'a': 2}])
+
+
+class JsonlWriterTest(parameterized.TestCase):
+
+  def test_write(self):
+    data = [{'step': i, 'path': Path('a', str(i))} for i in range(10)]
+    path = os.path.join(self.create_tempdir().full_path, 'out.jsonl')
+    with JsonlWriter(path, flush_records=3) as writer:
+      writer.write(data[0])
+      writer.write_many(data[1:])
+      self.assertEqual(writer.num_records, 10)
+      # the last record is still buffered.
+      self.assertLen(list(load_jsonl(path)), 9)
+    self.assertEqual(writer.paths, [Path(path)])
+    self.assertEqual(list(load_jsonl(path)),
+                     [{**x, 'path': str(x['path'])} for x in data])
+
+  def test_rotation(self):
+    data = [{'step': i} for i in range(100)]
+    path = os.path.join(self.create_tempdir().full_path, 'out.jsonl')
+    with JsonlWriter(path, max_shard_bytes=200, fsync=True) as writer:
+      writer.write_many(data)
+    self.assertGreater(len(writer.paths), 1)
+    self.assertEqual(writer.paths[0].name, 'out-00000.jsonl')
+    for shard_path in writer.paths:
+      self.assertLessEqual(os.path.getsize(shard_path), 200)
+    res = [x for p in writer.paths for x in load_jsonl(p)]
+    self.assertEqual(res, data)
+
+  def test_closed(self):
+    path = os.path.join(self.create_tempdir().full_path, 'out.jsonl')
+    with JsonlWriter(path) as writer:
+      writer.write({'step': 0})
+    writer.close()
+    with self.assertRaisesRegex(ValueError, 'closed JsonlWriter'):
+      writer.write({'step': 1})
+    with self.assertRaisesRegex(ValueError, 'closed JsonlWriter'):
+      writer.flush()
+    self.assertEqual(list(load_jsonl(path)), [{'step': 0}])
+
+
+class ShardedJsonlTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('num_shards', {'num_shards': 4}),
+      ('num_shards_processes', {'num_shards': 4, 'num_workers': 2}),
+      ('max_shard_bytes', {'max_shard_bytes': 300}),
+      ('compressed', {'num_shards': 3}, 'data.jsonl.gz'),
+  )
+  def test_roundtrip(self, kwargs, name='data.jsonl'):
+    data = [{'idx': i, 'text': 'x' * (i % 5)} for i in range(100)]
+    path = os.path.join(self.create_tempdir().full_path, name)
+    manifest_path = dump_jsonl_sharded(path, iter(data), **kwargs)
+    self.assertEqual(manifest_path.name, name + '.manifest')
+    with open(manifest_path, encoding='utf-8') as f:
+      manifest = json.load(f)
+    self.assertEqual(manifest['num_records'], 100)
+    self.assertEqual(
+        sum(shard['num_records'] for shard in manifest['shards']), 100)
+    self.assertEqual(list(load_jsonl_sharded(path)), data)
+    self.assertEqual(list(load_jsonl_sharded(manifest_path)), data)
+
+  def test_split_readers(self):
+    data = [{'idx': i} for i in range(100)]
+    path = os.path.join(self.create_tempdir().full_path, 'data.jsonl')
+    dump_jsonl_sharded(path, data, num_shards=7)
+    shards = [list_jsonl_shards(path, i, 3) for i in range(3)]
+    self.assertEqual(sorted(map(len, shards)), [2, 2, 3])
+    self.assertCountEqual([p.name for x in shards for p in x],
+                          [f'data-{i:05d}.jsonl' for i in range(7)])
+    res = [
+        x for i in range(3)
+        for x in load_jsonl_sharded(path, i, 3, columns=['idx'])
+    ]
+    self.assertCountEqual(res, data)
+    with self.assertRaises(ValueError):
+      list_jsonl_shards(path, 3, 3)
+
+  def test_invalid_arguments(self):
+    path = os.path.join(self.create_tempdir().full_path, 'data.jsonl')
+    with self.assertRaises(ValueError):
+      dump_jsonl_sharded(path, [], num_shards=2, max_shard_bytes=10)
+
+
+class ShuffledJsonlTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.data = [{'idx': i} for i in range(500)]
+    self.path = os.path.join(self.create_tempdir().full_path, 'data.jsonl')
+    dump_jsonl_sharded(self.path, self.data, num_shards=5)
+
+  @parameterized.parameters(0, 16)
+  def test_shuffle(self, prefetch):
+    res = list(load_jsonl_shuffled(self.path, buffer_size=50, seed=0,
+                                   prefetch=prefetch))
+    self.assertCountEqual(res, self.data)
+    self.assertNotEqual(res, self.data)
+    # The order only depends on the seed.
+    self.assertEqual(
+        list(load_jsonl_shuffled(self.path, buffer_size=50, seed=0)), res)
+    self.assertNotEqual(
+        list(load_jsonl_shuffled(self.path, buffer_size=50, seed=1)), res)
+
+  def test_paths(self):
+    paths = list_jsonl_shards(self.path)
+    res = list(load_jsonl_shuffled(paths, seed=0, num_epochs=2,
+                                   columns=['idx']))
+    self.assertCountEqual(res, self.data * 2)
+    res = [
+        x for i in range(2)
+        for x in load_jsonl_shuffled(paths, seed=0, shard_index=i, num_shards=2)
+    ]
+    self.assertCountEqual(res, self.data)
+
+  def test_repeat(self):
+    num_threads = threading.active_count()
+    it = load_jsonl_shuffled(self.path, buffer_size=10, seed=0,
+                             num_epochs=None)
+    res = [next(it)['idx'] for _ in range(1500)]
+    # closing the iterator stops the prefetching thread.
+    it.close()
+    self.assertEqual(threading.active_count(), num_threads)
+    self.assertLen(set(res), 500)
+
+  @parameterized.parameters(0, 16)
+  def test_repeat_empty(self, prefetch):
+    empty = self.create_tempfile().full_path
+    self.assertEmpty(
+        list(load_jsonl_shuffled(empty, num_epochs=None, prefetch=prefetch)))
+    # no records match `where`.
+    self.assertEmpty(
+        list(
+            load_jsonl_shuffled(self.path,
+                                num_epochs=None,
+                                prefetch=prefetch,
+                                where={'idx': -1})))
+
+  def test_error(self):
+    with open(list_jsonl_shards(self.path)[2], 'a', encoding='utf-8') as f:
+      f.write('{not json}\n')
+    with self.assertRaises(ValueError):
+      list(load_jsonl_shuffled(self.path, seed=0))
+
+
+class AsyncWriterTest(parameterized.TestCase):
+
+  def test_dump_async(self):
+    td = self.create_tempdir().full_path
+    data = [{'a': i} for i in range(5)]
+    with AsyncWriter(num_threads=2) as writer:
+      futures = [
+          dump_jsonl_async(os.path.join(td, f'{i}.jsonl'), data, writer=writer)
+          for i in range(4)
+      ]
+      json_future = dump_json_async(os.path.join(td, 'x.json'), {'a': 1},
+                                    writer=writer)
+      self.assertTrue(writer.flush(timeout=10))
+      for future in futures + [json_future]:
+        self.assertTrue(future.done())
+    for i in range(4):
+      self.assertEqual(list(load_jsonl(os.path.join(td, f'{i}.jsonl'))), data)
+
+  def test_errors_propagate(self):
+    with AsyncWriter() as writer:
+      future = writer.submit(lambda: 1 / 0)
+      with self.assertRaises(ZeroDivisionError):
+        future.result(timeout=10)
+
+  def test_drop_oldest(self):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+      started.set()
+      release.wait()
+
+    with AsyncWriter(max_queue_size=2, backpressure='drop_oldest') as writer:
+      writer.submit(blocking)
+      started.wait(timeout=10)
+      futures = [writer.submit(lambda i=i: i) for i in range(4)]
+      release.set()
+      self.assertTrue(writer.flush(timeout=10))
+    self.assertEqual(writer.num_dropped, 2)
+    self.assertEqual([f.cancelled() for f in futures],
+                     [True, True, False, False])
+    self.assertEqual(futures[-1].result(), 3)
+
+  def test_profiler_stats(self):
+    profiler.enable(strict=False)
+    try:
+      with AsyncWriter() as writer:
+        writer.submit(lambda: None).result(timeout=10)
+      self.assertIn('async_writer/queue_depth', profiler._counters)
+      self.assertIn('async_writer/queue_latency', profiler._counters)
+    finally:
+      profiler.disable()
+
 
 class DownloadFilesTest(parameterized.TestCase):
 
@@ -57,6 +826,249 @@ class DownloadFilesTest(parameterized.TestCase):
     num_completed = download_files(tasks, download_dir)
     self.assertEqual(num_completed, 0)
 
+  def test_download_files_local(self):
+    files = {f'/{i}.bin': os.urandom(1000 + i) for i in range(20)}
+    download_dir = self.create_tempdir().full_path
+    tasks = [{'filename': name[1:], 'url': None} for name in files]
+    tasks.append({'filename': 'missing', 'url': 'http://127.0.0.1:1/x'})
+    with LocalHTTPServer(files) as server:
+      for task in tasks[:-1]:
+        task['url'] = server.url('/' + task['filename'])
+      num_completed = download_files(tasks, download_dir, num_threads=2,
+                                     chunk_size=256)
+      # connections are reused by each thread.
+      self.assertLessEqual(server.num_connections, 2)
+    self.assertEqual(num_completed, 20)
+    for name, data in files.items():
+      with open(os.path.join(download_dir, name[1:]), 'rb') as f:
+        self.assertEqual(f.read(), data)
+    self.assertFalse(os.path.exists(os.path.join(download_dir, 'missing')))
+
+  def test_download_file_resume(self):
+    data = os.urandom(10000)
+    fpath = os.path.join(self.create_tempdir().full_path, 'a.bin')
+    with LocalHTTPServer({'/a.bin': data}) as server:
+      server.fail_after('/a.bin', 4000)
+      # the chunk being read when the connection drops is lost.
+      self.assertEqual(
+          _download_file((server.url('/a.bin'), fpath), chunk_size=1000)[0], 0)
+      # the partial file is kept, but never at the final path.
+      self.assertFalse(os.path.exists(fpath))
+      self.assertEqual(os.path.getsize(fpath + '.part'), 4000)
+      self.assertEqual(_download_file((server.url('/a.bin'), fpath)),
+                       (1, None))
+      self.assertEqual(server.range_headers, [None, 'bytes=4000-'])
+    with open(fpath, 'rb') as f:
+      self.assertEqual(f.read(), data)
+    self.assertEqual(os.listdir(os.path.dirname(fpath)), ['a.bin'])
+
+  def test_download_file_resume_changed(self):
+    files = {'/a.bin': os.urandom(10000)}
+    fpath = os.path.join(self.create_tempdir().full_path, 'a.bin')
+    with LocalHTTPServer(files) as server:
+      server.fail_after('/a.bin', 4000)
+      _download_file((server.url('/a.bin'), fpath), chunk_size=1000)
+      # If-Range no longer matches, so the full file is sent.
+      files['/a.bin'] = os.urandom(5000)
+      self.assertEqual(_download_file((server.url('/a.bin'), fpath)),
+                       (1, None))
+      self.assertEqual(server.range_headers, [None, 'bytes=4000-'])
+    with open(fpath, 'rb') as f:
+      self.assertEqual(f.read(), files['/a.bin'])
+
+  def test_download_file_resume_encoded(self):
+    data = os.urandom(10000)
+    fpath = os.path.join(self.create_tempdir().full_path, 'a.bin')
+    with LocalHTTPServer({'/a.bin': data}, compress=True) as server:
+      server.fail_after('/a.bin', 4000)
+      self.assertEqual(
+          _download_file((server.url('/a.bin'), fpath), chunk_size=1000)[0], 0)
+      # decoded offsets don't match the encoded ranges, so it restarts.
+      self.assertFalse(os.path.exists(fpath + '.part'))
+      self.assertEqual(_download_file((server.url('/a.bin'), fpath)),
+                       (1, None))
+      self.assertEqual(server.range_headers, [None, None])
+    with open(fpath, 'rb') as f:
+      self.assertEqual(f.read(), data)
+
+  def test_download_file_resume_complete(self):
+    data = os.urandom(1000)
+    fpath = os.path.join(self.create_tempdir().full_path, 'a.bin')
+    with LocalHTTPServer({'/a.bin': data}) as server:
+      server.fail_after('/a.bin', 1000)
+      # The response is complete, so this only simulates a crash before the
+      # partial file was renamed.
+      _download_file((server.url('/a.bin'), fpath))
+      os.rename(fpath, fpath + '.part')
+      with open(fpath + '.part.json', 'wb') as f:
+        f.write(b'{"url": "%s", "validator": "%s"}' %
+                (server.url('/a.bin').encode(),
+                 server.httpd.last_modified.encode()))
+      self.assertEqual(_download_file((server.url('/a.bin'), fpath)),
+                       (1, None))
+      self.assertEqual(server.range_headers[-1], 'bytes=1000-')
+    with open(fpath, 'rb') as f:
+      self.assertEqual(f.read(), data)
+
+  def test_download_file_split(self):
+    data = os.urandom(100003)
+    fpath = os.path.join(self.create_tempdir().full_path, 'a.bin')
+    with LocalHTTPServer({'/a.bin': data}) as server:
+      res = _download_file((server.url('/a.bin'), fpath),
+                           chunk_size=1000,
+                           split_threshold=100000,
+                           num_ranges=4)
+      self.assertEqual(res, (1, None))
+      self.assertEqual(server.range_headers[0], None)
+      self.assertCountEqual(server.range_headers[1:], [
+          'bytes=0-24999', 'bytes=25000-50000', 'bytes=50001-75001',
+          'bytes=75002-100002'
+      ])
+      # files below the threshold use a single request.
+      res = _download_file((server.url('/a.bin'), fpath),
+                           split_threshold=100004)
+      self.assertEqual(res, (1, None))
+      self.assertLen(server.range_headers, 6)
+    with open(fpath, 'rb') as f:
+      self.assertEqual(f.read(), data)
+    self.assertEqual(os.listdir(os.path.dirname(fpath)), ['a.bin'])
+
+  def test_download_file_split_error(self):
+    fpath = os.path.join(self.create_tempdir().full_path, 'a.bin')
+    with LocalHTTPServer({'/a.bin': os.urandom(10000)}) as server:
+      with mock.patch.object(io_util, '_resume_validator',
+                             return_value='"stale"'):
+        # ranges of another version of the file are not mixed.
+        res = _download_file((server.url('/a.bin'), fpath),
+                             split_threshold=1000,
+                             num_ranges=2)
+      self.assertEqual(res[0], 0)
+    self.assertEqual(os.listdir(os.path.dirname(fpath)), [])
+
+  def test_download_files_resume(self):
+    files = {f'/{i}.bin': os.urandom(5000) for i in range(4)}
+    download_dir = self.create_tempdir().full_path
+    with LocalHTTPServer(files) as server:
+      tasks = [{'filename': name[1:], 'url': server.url(name)}
+               for name in files]
+      server.fail_after('/0.bin', 1000)
+      self.assertEqual(
+          download_files(tasks, download_dir, num_threads=2, chunk_size=500),
+          3)
+      self.assertEqual(download_files(tasks, download_dir, num_threads=2), 1)
+      self.assertIn('bytes=1000-', server.range_headers)
+      # without resuming, the partial file is discarded.
+      os.remove(os.path.join(download_dir, '0.bin'))
+      server.fail_after('/0.bin', 1000)
+      self.assertEqual(download_files(tasks, download_dir, chunk_size=500), 0)
+      self.assertEqual(download_files(tasks, download_dir, resume=False), 1)
+      self.assertEqual(download_files(tasks, download_dir, clobber=True), 4)
+      self.assertNotIn('bytes=1000-', server.range_headers[-5:])
+    for name, data in files.items():
+      with open(os.path.join(download_dir, name[1:]), 'rb') as f:
+        self.assertEqual(f.read(), data)
+
+  @parameterized.named_parameters(('aiohttp', True), ('executor', False))
+  def test_download_files_asyncio(self, use_aiohttp):
+    files = {f'/{i}.bin': os.urandom(1000 + i) for i in range(20)}
+    download_dir = self.create_tempdir().full_path
+    tasks = [{'filename': name[1:], 'url': None} for name in files]
+    tasks.append({'filename': 'missing', 'url': None})
+    with mock.patch.object(io_util, 'aiohttp',
+                           io_util.aiohttp if use_aiohttp else None), \
+         LocalHTTPServer(files) as server:
+      for task in tasks:
+        task['url'] = server.url('/' + task['filename'])
+      num_completed = download_files(tasks,
+                                     download_dir,
+                                     backend='asyncio',
+                                     max_concurrency=4,
+                                     chunk_size=256)
+      self.assertLessEqual(server.max_active_requests, 4)
+    self.assertEqual(num_completed, 20)
+    for name, data in files.items():
+      with open(os.path.join(download_dir, name[1:]), 'rb') as f:
+        self.assertEqual(f.read(), data)
+    self.assertFalse(os.path.exists(os.path.join(download_dir, 'missing')))
+
+  def test_download_files_asyncio_per_host(self):
+    files = {f'/{i}.bin': os.urandom(100) for i in range(12)}
+    download_dir = self.create_tempdir().full_path
+    with LocalHTTPServer(files, delay=0.05) as server:
+      tasks = [{'filename': name[1:], 'url': server.url(name)}
+               for name in files]
+      num_completed = download_files(tasks,
+                                     download_dir,
+                                     backend='asyncio',
+                                     max_concurrency=8,
+                                     max_per_host=3)
+      self.assertEqual(num_completed, 12)
+      self.assertEqual(server.max_active_requests, 3)
+
+  def test_download_files_asyncio_running_loop(self):
+    files = {f'/{i}.bin': os.urandom(100) for i in range(3)}
+    download_dir = self.create_tempdir().full_path
+    on_loop = []
+    write_part_meta = io_util._write_part_meta
+
+    def record_thread(*args):
+      try:
+        asyncio.get_running_loop()
+        on_loop.append(True)
+      except RuntimeError:
+        on_loop.append(False)
+      return write_part_meta(*args)
+
+    async def main():
+      # e.g. from a jupyter notebook.
+      return download_files(tasks, download_dir, backend='asyncio')
+
+    with LocalHTTPServer(files) as server, \
+         mock.patch.object(io_util, '_write_part_meta', record_thread):
+      tasks = [{'filename': name[1:], 'url': server.url(name)}
+               for name in files]
+      self.assertEqual(asyncio.run(main()), 3)
+    self.assertLen(os.listdir(download_dir), 3)
+    # file operations run off the event loop.
+    self.assertEqual(on_loop, [False] * 3)
+
+  def test_download_files_asyncio_resume(self):
+    data = os.urandom(10000)
+    download_dir = self.create_tempdir().full_path
+    with LocalHTTPServer({'/a.bin': data}) as server:
+      tasks = [{'filename': 'a.bin', 'url': server.url('/a.bin')}]
+      server.fail_after('/a.bin', 4000)
+      self.assertEqual(
+          download_files(tasks, download_dir, backend='asyncio',
+                         chunk_size=1000), 0)
+      self.assertEqual(
+          download_files(tasks, download_dir, backend='asyncio'), 1)
+      # how much of the first response was written depends on timing.
+      self.assertLen(server.range_headers, 2)
+      self.assertRegex(server.range_headers[1], r'^bytes=\d+-$')
+    with open(os.path.join(download_dir, 'a.bin'), 'rb') as f:
+      self.assertEqual(f.read(), data)
+
+  def test_download_files_asyncio_resume_encoded(self):
+    data = os.urandom(10000)
+    download_dir = self.create_tempdir().full_path
+    with LocalHTTPServer({'/a.bin': data}, compress=True) as server:
+      tasks = [{'filename': 'a.bin', 'url': server.url('/a.bin')}]
+      server.fail_after('/a.bin', 4000)
+      self.assertEqual(
+          download_files(tasks, download_dir, backend='asyncio',
+                         chunk_size=1000), 0)
+      self.assertEqual(os.listdir(download_dir), [])
+      self.assertEqual(
+          download_files(tasks, download_dir, backend='asyncio'), 1)
+      self.assertEqual(server.range_headers, [None, None])
+    with open(os.path.join(download_dir, 'a.bin'), 'rb') as f:
+      self.assertEqual(f.read(), data)
+
+  def test_download_files_unknown_backend(self):
+    with self.assertRaisesRegex(ValueError, 'Unknown backend'):
+      download_files([], backend='gevent')
+
   @parameterized.parameters(
       (
           'bazel::rf://com_github_corypaik_research/labtools/__init__.py',
@@ -97,6 +1109,23 @@ class DownloadFilesTest(parameterized.TestCase):
     expected = os.path.normpath(path)
     self.assertEqual(res, expected)
 
+  def test_resolve_paths(self):
+    td = self.create_tempdir()
+    os.makedirs(os.path.join(td, 'a'))
+    paths = [os.path.join(td, 'a'), os.path.join(td, 'a', '..', 'b')]
+    paths += [os.path.join(td, 'a', str(i)) for i in range(10)]
+    for path in paths[1:]:
+      self.create_tempfile(path)
+    res = resolve_paths(paths + ['gs://bucket/x'], check_exists=True)
+    self.assertEqual(res,
+                     list(map(os.path.normpath, paths)) + ['gs://bucket/x'])
+    with self.assertRaisesRegex(FileNotFoundError, '2 of 3 paths'):
+      resolve_paths(
+          [paths[0], os.path.join(td, 'c'), os.path.join(td, 'c', 'd')],
+          check_exists=True)
+    self.assertEqual(resolve_paths(['/'], check_exists=True), ['/'])
+    self.assertEqual(resolve_paths(['bazel::ws://x']), [os.path.abspath('x')])
+
   @parameterized.parameters(*known_implementations)
   def test_ignore_fsspec_protocols(self, protocol):
     """ Tests that we don't conflict with fsspec protocols """
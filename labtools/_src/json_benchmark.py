@@ -0,0 +1,115 @@
+# Copyright 2021 Cory Paik. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+""" Benchmarks JSON serialization throughput.
+
+Example:
+  $ bazel run //labtools/_src:json_benchmark -- --num_records=5000
+"""
+import time
+
+from absl import app
+from absl import flags
+import numpy as np
+
+from labtools._src.util import BestEffortJSONEncoder
+from labtools._src.util import CustomJSONEncoder
+from labtools._src.util import is_installed
+from labtools._src.util import json_dumps
+from labtools._src.util import json_loads
+from labtools._src.util import maybe_import
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('num_records', 2000, 'Number of records to encode.')
+flags.DEFINE_integer('array_size', 256, 'Size of the arrays in each record.')
+flags.DEFINE_integer('repeats', 3, 'Number of repeats, the best is reported.')
+flags.DEFINE_list('benchmarks', ['backends', 'encoder'], 'Benchmarks to run.')
+
+_BACKENDS = ('json', 'orjson', 'ujson', 'simdjson')
+
+
+def _best_time(fn) -> float:
+  times = []
+  for _ in range(FLAGS.repeats):
+    tick = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - tick)
+  return min(times)
+
+
+def _array_records(rng: np.random.RandomState) -> list:
+  return [{
+      'idx': i,
+      'split': 'test',
+      'logits': rng.randn(FLAGS.array_size).astype(np.float32),
+      'labels': rng.randint(0, 10, size=FLAGS.array_size),
+      'scores': rng.rand(FLAGS.array_size).tolist(),
+  } for i in range(FLAGS.num_records)]
+
+
+def benchmark_backends():
+  records = _array_records(np.random.RandomState(0))
+  print(f'{"backend":<10} {"dumps rec/s":>12} {"dumps MB/s":>11} '
+        f'{"loads rec/s":>12} {"loads MB/s":>11}')
+  for backend in _BACKENDS:
+    if backend != 'json' and not is_installed(backend):
+      print(f'{backend:<10} (not installed)')
+      continue
+
+    def dumps(backend=backend):
+      return [
+          json_dumps(r, cls=BestEffortJSONEncoder, backend=backend)
+          for r in records
+      ]
+
+    encoded = dumps('json')
+    num_bytes = sum(map(len, encoded)) / 2**20
+    dumps_time = _best_time(dumps)
+    loads_time = _best_time(
+        lambda backend=backend: [json_loads(s, backend=backend)
+                                 for s in encoded])
+    # simdjson only implements loads, json_dumps falls back to the stdlib.
+    print(f'{backend:<10} {len(records) / dumps_time:>12.0f} '
+          f'{num_bytes / dumps_time:>11.1f} {len(records) / loads_time:>12.0f} '
+          f'{num_bytes / loads_time:>11.1f}')
+
+
+def benchmark_encoder():
+  """ Measures the overhead of `CustomJSONEncoder.default` per object. """
+  payloads = {'numpy': lambda i: np.full(4, i, dtype=np.float32)}
+  torch = maybe_import('torch')
+  if torch is not None:
+    payloads['torch'] = lambda i: torch.full((4,), i)
+  ml_collections = maybe_import('ml_collections')
+  if ml_collections is not None:
+    payloads['config_dict'] = lambda i: ml_collections.ConfigDict({'i': i})
+
+  print(f'{"payload":<12} {"objects/s":>12}')
+  for name, make in payloads.items():
+    # thousands of small objects, all encoded through `default`.
+    record = {str(i): make(i) for i in range(FLAGS.array_size * 4)}
+    elapsed = _best_time(lambda record=record: json_dumps(
+        record, cls=CustomJSONEncoder, backend='json'))
+    print(f'{name:<12} {len(record) / elapsed:>12.0f}')
+
+
+def main(_):
+  if 'backends' in FLAGS.benchmarks:
+    benchmark_backends()
+  if 'encoder' in FLAGS.benchmarks:
+    benchmark_encoder()
+
+
+if __name__ == '__main__':
+  app.run(main)
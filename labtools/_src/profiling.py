@@ -190,6 +190,11 @@ class Profiler(metaclass=Singleton):
         logging.warning(
             'Attemting to call profiler.end() on uninitialized timer.')
 
+  def record(self, name: str, value: Number):
+    """ Records a value (e.g. a queue depth or latency) under `name`. """
+    if self._enabled:
+      self._counters[name].update(value)
+
   def __str__(self):
     out = f'Profiler results ({self._default_name})\n'
     if len(self._counters) > 0:
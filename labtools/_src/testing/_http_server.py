@@ -0,0 +1,206 @@
+# Copyright 2021 Cory Paik. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+""" A local HTTP server for testing and benchmarking downloads. """
+
+import email.utils
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class _Handler(BaseHTTPRequestHandler):
+  # Required for keep-alive connections.
+  protocol_version = 'HTTP/1.1'
+
+  def setup(self):
+    super().setup()
+    # As in production servers, otherwise responses to keep-alive connections
+    # are delayed until the client acknowledges the headers.
+    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    with self.server.lock:
+      self.server.num_connections += 1
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    with self.server.lock:
+      self.server.num_requests += 1
+      self.server.range_headers.append(self.headers.get('Range'))
+      self.server.num_active += 1
+      self.server.max_active = max(self.server.max_active,
+                                   self.server.num_active)
+    try:
+      time.sleep(self.server.delay)
+      self._get()
+    finally:
+      with self.server.lock:
+        self.server.num_active -= 1
+
+  def _get(self):
+    data = self.server.files.get(self.path)
+    if data is None:
+      self.send_error(404)
+      return
+    encoding = None
+    if (self.server.compress and
+        'gzip' in self.headers.get('Accept-Encoding', '')):
+      # As for pre-compressed files, byte ranges refer to the encoded data.
+      encoding, data = 'gzip', self.server.gzipped(self.path, data)
+    etag = self.server.etag(self.path, data)
+    start, end = 0, len(data)
+    status = 200
+    range_header = self.headers.get('Range')
+    if_range = self.headers.get('If-Range')
+    if (range_header is not None and
+        if_range in (None, etag, self.server.last_modified)):
+      start_str, _, end_str = range_header.split('=', 1)[1].partition('-')
+      start = int(start_str)
+      end = min(int(end_str) + 1, len(data)) if end_str else len(data)
+      if start >= len(data):
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{len(data)}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+      status = 206
+
+    self.send_response(status)
+    self.send_header('Accept-Ranges', 'bytes')
+    self.send_header('ETag', etag)
+    self.send_header('Last-Modified', self.server.last_modified)
+    self.send_header('Content-Length', str(end - start))
+    if encoding is not None:
+      self.send_header('Content-Encoding', encoding)
+    if status == 206:
+      self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(data)}')
+    self.end_headers()
+    # Simulates a dropped connection after sending `fail_after` bytes.
+    fail_after = self.server.fail_after.pop(self.path, None)
+    if fail_after is not None:
+      self.wfile.write(data[start:start + fail_after])
+      self.close_connection = True
+      return
+    self.wfile.write(data[start:end])
+
+  def log_message(self, *args):
+    pass
+
+
+class _Server(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def etag(self, path, data):
+    """ Returns the entity tag of `data`, caching it for large files. """
+    with self.lock:
+      cached_data, etag = self.etags.get(path, (None, None))
+    if cached_data is not data:
+      etag = '"%s"' % hashlib.md5(data).hexdigest()
+      with self.lock:
+        self.etags[path] = (data, etag)
+    return etag
+
+  def gzipped(self, path, data):
+    """ Returns `data` compressed with gzip, caching it as for `etag`. """
+    with self.lock:
+      cached_data, encoded = self.encoded.get(path, (None, None))
+    if cached_data is not data:
+      encoded = gzip.compress(data, mtime=0)
+      with self.lock:
+        self.encoded[path] = (data, encoded)
+    return encoded
+
+  def handle_error(self, request, client_address):
+    # Clients may close connections without reading the full response.
+    if not isinstance(sys.exc_info()[1], ConnectionError):
+      super().handle_error(request, client_address)
+
+
+class LocalHTTPServer:
+  """ Serves in-memory files over HTTP/1.1 on a background thread.
+
+  Responses support single byte ranges, with `ETag` and `Last-Modified`
+  validators for `If-Range`, and optionally gzip content encoding.
+
+  Example:
+    >>> with LocalHTTPServer({'/a.txt': b'hello'}) as server:
+    ...   requests.get(server.url('/a.txt')).content
+    b'hello'
+
+  Args:
+    files: Mapping from url paths (e.g. `'/a.txt'`) to their contents.
+    delay: Seconds to wait before handling each request.
+    compress: Predicate indicating whether to compress responses with gzip for
+      clients which accept it.
+  """
+
+  def __init__(self, files: Dict[str, bytes], delay: float = 0.0,
+               compress: bool = False):
+    self.httpd = _Server(('127.0.0.1', 0), _Handler)
+    self.httpd.files = files
+    self.httpd.lock = threading.Lock()
+    self.httpd.num_connections = 0
+    self.httpd.num_requests = 0
+    self.httpd.range_headers = []
+    self.httpd.fail_after = {}
+    self.httpd.etags = {}
+    self.httpd.compress = compress
+    self.httpd.encoded = {}
+    self.httpd.delay = delay
+    self.httpd.num_active = 0
+    self.httpd.max_active = 0
+    self.httpd.last_modified = email.utils.formatdate(usegmt=True)
+    self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                    daemon=True)
+
+  @property
+  def num_connections(self) -> int:
+    """ Number of TCP connections accepted so far. """
+    return self.httpd.num_connections
+
+  @property
+  def num_requests(self) -> int:
+    """ Number of GET requests handled so far. """
+    return self.httpd.num_requests
+
+  @property
+  def max_active_requests(self) -> int:
+    """ Maximum number of GET requests handled at the same time so far. """
+    return self.httpd.max_active
+
+  @property
+  def range_headers(self) -> List[Optional[str]]:
+    """ The `Range` header of each GET request, or None if there was none. """
+    return self.httpd.range_headers
+
+  def fail_after(self, path: str, num_bytes: int) -> None:
+    """ Drops the connection of the next request for `path` mid-response. """
+    self.httpd.fail_after[path] = num_bytes
+
+  def url(self, path: str) -> str:
+    host, port = self.httpd.server_address[:2]
+    return f'http://{host}:{port}{path}'
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+    self._thread.join()
@@ -0,0 +1,413 @@
+# Copyright 2021 Cory Paik. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+""" Reading and writing TFRecord files without TensorFlow.
+
+Each record of a TFRecord file is stored as
+  `[length: uint64][masked crc32c of length: uint32][data][masked crc32c of
+  data: uint32]`
+with all integers in little-endian order. Records are arbitrary bytes (e.g.
+serialized `tf.train.Example`s). By default, `dump_tfrecord` and
+`load_tfrecord` store json encoded objects, so they can be used in place of
+`dump_jsonl` and `load_jsonl`.
+
+"""
+from __future__ import annotations
+
+from array import array
+from collections.abc import Sequence
+import io
+import itertools
+import multiprocessing as mp
+from pathlib import Path
+import struct
+from typing import (Any, Callable, Generator, Iterable, Iterator, List,
+                    Optional, Tuple, Union)
+
+from absl import logging
+
+from labtools._src.io_util import _check_uncompressed
+from labtools._src.io_util import _infer_compression
+from labtools._src.io_util import _open
+from labtools._src.io_util import _read_index
+from labtools._src.io_util import _write_index
+from labtools._src.util import BestEffortJSONEncoder
+from labtools._src.util import CustomJSONEncoder
+from labtools._src.util import json_dumps
+from labtools._src.util import json_loads
+from labtools._src.util import maybe_import
+
+crc32c = maybe_import('crc32c')
+google_crc32c = maybe_import('google_crc32c')
+
+_HEADER = struct.Struct('<QI')
+_FOOTER = struct.Struct('<I')
+_MASK_DELTA = 0xa282ead8
+
+
+def _make_crc32c_table() -> List[int]:
+  table = []
+  for i in range(256):
+    crc = i
+    for _ in range(8):
+      crc = (crc >> 1) ^ 0x82f63b78 if crc & 1 else crc >> 1
+    table.append(crc)
+  return table
+
+
+_CRC32C_TABLE = _make_crc32c_table()
+
+
+def _crc32c_python(data: bytes) -> int:
+  crc = 0xffffffff
+  table = _CRC32C_TABLE
+  for b in data:
+    crc = table[(crc ^ b) & 0xff] ^ (crc >> 8)
+  return crc ^ 0xffffffff
+
+
+# Prefer a native implementation, which is several orders of magnitude faster.
+if crc32c is not None:
+  _crc32c = crc32c.crc32c
+elif google_crc32c is not None and google_crc32c.implementation == 'c':
+
+  def _crc32c(data: bytes) -> int:
+    # `google_crc32c` only accepts bytes, and `bytes` does not copy bytes.
+    return google_crc32c.value(bytes(data))
+
+else:
+  _crc32c = _crc32c_python
+
+
+def _masked_crc32c(data: bytes) -> int:
+  crc = _crc32c(data)
+  return (((crc >> 15) | (crc << 17)) + _MASK_DELTA) & 0xffffffff
+
+
+def _encode_tfrecord(data: bytes) -> bytes:
+  header = struct.pack('<Q', len(data))
+  return b''.join([
+      header,
+      _FOOTER.pack(_masked_crc32c(header)),
+      data,
+      _FOOTER.pack(_masked_crc32c(data)),
+  ])
+
+
+def _iter_tfrecords(f, check_crc: bool = True,
+                    path: Any = None) -> Generator[bytes, None, None]:
+  """ Reads records from a file object until the end of the file. """
+  while True:
+    header = f.read(_HEADER.size)
+    if not header:
+      return
+    if len(header) != _HEADER.size:
+      raise ValueError(f'Truncated record header in {path}.')
+    length, length_crc = _HEADER.unpack(header)
+    if check_crc and _masked_crc32c(header[:8]) != length_crc:
+      raise ValueError(f'Corrupt record length in {path}.')
+    data = f.read(length)
+    footer = f.read(_FOOTER.size)
+    if len(data) != length or len(footer) != _FOOTER.size:
+      raise ValueError(f'Truncated record in {path}.')
+    if check_crc and _masked_crc32c(data) != _FOOTER.unpack(footer)[0]:
+      raise ValueError(f'Corrupt record data in {path}.')
+    yield data
+
+
+def _build_tfrecord_index(path: Union[Path, str]) -> array:
+  """ Scans the headers of a TFRecord file for the offset of each record.
+
+  Returns:
+    An array of unsigned 64-bit integers containing the starting offset of each
+    record followed by the size of the file, such that record `i` spans the
+    bytes `[offsets[i], offsets[i + 1])`.
+  """
+  offsets, pos = array('Q'), 0
+  with open(path, 'rb') as f:
+    while True:
+      header = f.read(_HEADER.size)
+      if len(header) < _HEADER.size:
+        break
+      offsets.append(pos)
+      pos += _HEADER.size + _HEADER.unpack(header)[0] + _FOOTER.size
+      f.seek(pos)
+  offsets.append(pos)
+  return offsets
+
+
+def _tfrecord_index(path: Union[Path, str], save_index: bool) -> array:
+  """ Reads the index of a TFRecord file, building it if needed. """
+  offsets = _read_index(path)
+  if offsets is None:
+    offsets = _build_tfrecord_index(path)
+    if save_index:
+      try:
+        _write_index(path, offsets)
+      except OSError:
+        logging.warning('Failed to write tfrecord index for %s', path)
+  return offsets
+
+
+def _encode_fn(relaxed: bool) -> Callable[[Any], bytes]:
+  cls = BestEffortJSONEncoder if relaxed else CustomJSONEncoder
+
+  def encode(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+      return obj
+    return json_dumps(obj, cls=cls).encode('utf-8')
+
+  return encode
+
+
+class TFRecordWriter:
+  """ Streaming TFRecord writer.
+
+  Example:
+    >>> with TFRecordWriter('data.tfrecord') as writer:
+    ...   for example in examples:
+    ...     writer.write(example.SerializeToString())
+
+  Args:
+    path: Path to the TFRecord file.
+    compression: Compression codec, inferred from the suffix of `path` by
+      default. See `labtools._src.io_util._open` for details.
+  """
+
+  def __init__(self,
+               path: Union[Path, str],
+               compression: Optional[str] = 'infer'):
+    self.path = Path(path)
+    self.path.parent.mkdir(exist_ok=True, parents=True)
+    self.num_records = 0
+    # Offsets of each record and the end of the last record, as in the index.
+    self.offsets = array('Q', [0])
+    self._file = _open(self.path, 'wb', compression)
+
+  def write(self, data: bytes) -> None:
+    """ Write a single record. """
+    record = _encode_tfrecord(data)
+    self._file.write(record)
+    self.offsets.append(self.offsets[-1] + len(record))
+    self.num_records += 1
+
+  def close(self) -> None:
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def dump_tfrecord(path: Union[Path, str],
+                  data: Iterable[Any],
+                  relaxed: bool = True,
+                  encode: Optional[Callable[[Any], bytes]] = None,
+                  write_index: bool = False,
+                  compression: Optional[str] = 'infer'):
+  """ Dump to a TFRecord file.
+
+  Args:
+    path: Path to the TFRecord file.
+    data: Records to write.
+    relaxed: predicate indicating whether to throw an error when part of the
+      data cannot be encoded using CustomJSONEncoder.
+    encode: Function converting each record to bytes. By default, bytes are
+      written as-is and other objects are encoded as json.
+    write_index: Predicate indicating whether to also write a `<path>.idx`
+      sidecar with the byte offset of each record, for `TFRecordFile` and
+      parallel reads. Not supported for compressed files.
+    compression: Compression codec, inferred from the suffix of `path` by
+      default. See `labtools._src.io_util._open` for details.
+  """
+  codec = _infer_compression(path, compression, mode='w')
+  if write_index and codec is not None:
+    raise ValueError(f'write_index is not supported for {codec} compressed '
+                     'files.')
+  encode = encode or _encode_fn(relaxed)
+  with TFRecordWriter(path, codec) as writer:
+    for obj in data:
+      writer.write(encode(obj))
+  if write_index:
+    _write_index(path, writer.offsets)
+
+
+def _decode_tfrecord_range(
+    task: Tuple[str, int, int, bool, Optional[Callable[[bytes], Any]]]
+) -> List[Any]:
+  """ Decode all records within a single byte range of a TFRecord file.
+
+  Args:
+    task: A tuple containing `(path, start, end, check_crc, decode)`. The range
+      must be aligned to record boundaries.
+  """
+  path, start, end, check_crc, decode = task
+  with open(path, 'rb') as f:
+    f.seek(start)
+    buf = io.BytesIO(f.read(end - start))
+  records = _iter_tfrecords(buf, check_crc, path)
+  return list(records if decode is None else map(decode, records))
+
+
+def _tfrecord_byte_ranges(path: Union[Path, str],
+                          chunk_size: int) -> List[Tuple[int, int]]:
+  """ Splits a TFRecord file into ranges of whole records. """
+  offsets = _tfrecord_index(path, save_index=True)
+  ranges, start = [], 0
+  for offset in offsets[1:]:
+    if offset - start >= chunk_size or offset == offsets[-1]:
+      ranges.append((start, offset))
+      start = offset
+  return [(start, end) for start, end in ranges if end > start]
+
+
+def load_tfrecord(
+    paths: Union[Path, str, Iterable[Union[Path, str]]],
+    num_workers: Optional[int] = None,
+    chunk_size: int = 16 * 2**20,
+    ordered: bool = True,
+    compression: Optional[str] = 'infer',
+    decode: Optional[Callable[[bytes], Any]] = json_loads,
+    check_crc: bool = True,
+) -> Generator[Any, None, None]:
+  """ Load from one or more TFRecord files.
+
+  Args:
+    paths: Path(s) to the TFRecord file(s).
+    num_workers: Number of processes to use for reading. If provided, each file
+      is split into ranges of whole records of roughly `chunk_size` bytes
+      (using its `<path>.idx` index, which is built if missing), and ranges of
+      all files are read and decoded in a process pool. Defaults to reading
+      serially on the calling thread.
+    chunk_size: Approximate size (in bytes) of each range when reading in
+      parallel.
+    ordered: Predicate indicating whether records should be yielded in their
+      original order when reading in parallel. Otherwise ranges are
+      interleaved across files, and records are yielded as soon as any range
+      is read.
+    compression: Compression codec, detected from the contents of the file by
+      default. Compressed files do not support `num_workers`.
+    decode: Function applied to the bytes of each record, which must be
+      picklable when using `num_workers`. Defaults to decoding json, as
+      written by `dump_tfrecord`. Use None to get the raw bytes, e.g. for
+      `tf.train.Example`s.
+    check_crc: Predicate indicating whether to verify the checksums of each
+      record. This is fast when `google-crc32c` or `crc32c` is installed, and
+      slow otherwise.
+
+  Example:
+    >>> for record in load_tfrecord('data.tfrecord'):  # was load_jsonl
+    ...   process(record)
+  """
+  if isinstance(paths, (str, Path)):
+    paths = [paths]
+  paths = list(map(str, paths))
+
+  if num_workers is not None and num_workers > 1:
+    for path in paths:
+      _check_uncompressed(path, 'num_workers')
+    file_tasks = [[(path, start, end, check_crc, decode)
+                   for start, end in _tfrecord_byte_ranges(path, chunk_size)]
+                  for path in paths]
+    if ordered:
+      tasks = list(itertools.chain.from_iterable(file_tasks))
+    else:
+      tasks = [
+          task for tasks in itertools.zip_longest(*file_tasks)
+          for task in tasks if task is not None
+      ]
+    with mp.Pool(num_workers) as p:
+      imap = p.imap if ordered else p.imap_unordered
+      for records in imap(_decode_tfrecord_range, tasks):
+        yield from records
+      # shutdown cleanly, exiting the context manager terminates the workers.
+      p.close()
+      p.join()
+    return
+
+  for path in paths:
+    with _open(path, 'rb', compression) as f:
+      for record in _iter_tfrecords(f, check_crc, path):
+        yield record if decode is None else decode(record)
+
+
+class TFRecordFile(Sequence):
+  """ Random access to the records of a TFRecord file.
+
+  Records are located using the `<path>.idx` sidecar written by
+  `dump_tfrecord(..., write_index=True)`, which is rebuilt from the record
+  headers (and optionally saved) if it is missing or out of date.
+
+  Example:
+    >>> with TFRecordFile('data.tfrecord') as f:
+    ...   first, last = f[0], f[-1]
+
+  Args:
+    path: Path to the TFRecord file.
+    decode: Function applied to the bytes of each record. Defaults to decoding
+      json. Use None to get the raw bytes.
+    check_crc: Predicate indicating whether to verify the checksums of each
+      record.
+    save_index: Predicate indicating whether to write the index sidecar when it
+      has to be rebuilt.
+  """
+
+  def __init__(self,
+               path: Union[Path, str],
+               decode: Optional[Callable[[bytes], Any]] = json_loads,
+               check_crc: bool = True,
+               save_index: bool = True):
+    self.path = Path(path)
+    _check_uncompressed(self.path, 'TFRecordFile')
+    self.decode = decode
+    self.check_crc = check_crc
+    self._offsets = _tfrecord_index(self.path, save_index)
+    self._file = open(self.path, 'rb')
+
+  def __len__(self) -> int:
+    return len(self._offsets) - 1
+
+  def _read(self, idx: int) -> Any:
+    start, end = self._offsets[idx], self._offsets[idx + 1]
+    self._file.seek(start)
+    buf = io.BytesIO(self._file.read(end - start))
+    (record,) = _iter_tfrecords(buf, self.check_crc, self.path)
+    return record if self.decode is None else self.decode(record)
+
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return [self._read(i) for i in range(*idx.indices(len(self)))]
+    n = len(self)
+    if idx < 0:
+      idx += n
+    if not 0 <= idx < n:
+      raise IndexError('TFRecordFile index out of range')
+    return self._read(idx)
+
+  def __iter__(self) -> Iterator[Any]:
+    for idx in range(len(self)):
+      yield self._read(idx)
+
+  def close(self):
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
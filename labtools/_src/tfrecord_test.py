@@ -0,0 +1,124 @@
+# Copyright 2021 Cory Paik. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+""" Provides tests for `labtools._src.tfrecord` """
+
+import os
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+from labtools._src import tfrecord
+from labtools._src.tfrecord import dump_tfrecord
+from labtools._src.tfrecord import load_tfrecord
+from labtools._src.tfrecord import TFRecordFile
+from labtools._src.tfrecord import TFRecordWriter
+
+
+class CRC32CTest(parameterized.TestCase):
+
+  def test_check_value(self):
+    self.assertEqual(tfrecord._crc32c(b'123456789'), 0xe3069283)
+    self.assertEqual(tfrecord._crc32c_python(b'123456789'), 0xe3069283)
+
+  def test_encode(self):
+
+    def unmask(masked):
+      rot = (masked - 0xa282ead8) & 0xffffffff
+      return ((rot >> 17) | (rot << 15)) & 0xffffffff
+
+    record = tfrecord._encode_tfrecord(b'abc')
+    self.assertLen(record, 8 + 4 + 3 + 4)
+    self.assertEqual(int.from_bytes(record[:8], 'little'), 3)
+    self.assertEqual(unmask(int.from_bytes(record[8:12], 'little')),
+                     tfrecord._crc32c(record[:8]))
+    self.assertEqual(record[12:15], b'abc')
+    self.assertEqual(unmask(int.from_bytes(record[15:], 'little')),
+                     tfrecord._crc32c(b'abc'))
+
+
+class TFRecordTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.data = [{'idx': i, 'text': 'x' * i} for i in range(200)]
+    self.path = os.path.join(self.create_tempdir().full_path, 'data.tfrecord')
+
+  @parameterized.parameters('data.tfrecord', 'data.tfrecord.gz')
+  def test_roundtrip(self, name):
+    path = os.path.join(self.create_tempdir().full_path, name)
+    dump_tfrecord(path, self.data)
+    self.assertEqual(list(load_tfrecord(path)), self.data)
+
+  def test_python_crc32c(self):
+    with mock.patch.object(tfrecord, '_crc32c', tfrecord._crc32c_python):
+      dump_tfrecord(self.path, self.data[:10])
+    self.assertEqual(list(load_tfrecord(self.path)), self.data[:10])
+
+  def test_bytes(self):
+    with TFRecordWriter(self.path) as writer:
+      writer.write(b'\x00\x01')
+      writer.write(b'')
+    self.assertEqual(writer.num_records, 2)
+    self.assertEqual(list(load_tfrecord(self.path, decode=None)),
+                     [b'\x00\x01', b''])
+
+  def test_corrupt(self):
+    dump_tfrecord(self.path, self.data)
+    with open(self.path, 'r+b') as f:
+      # flips a bit of the text of a record, which then still decodes.
+      offset = f.read().index(b'xxxx')
+      f.seek(offset)
+      f.write(b'y')
+    with self.assertRaisesRegex(ValueError, 'Corrupt'):
+      list(load_tfrecord(self.path))
+    self.assertLen(list(load_tfrecord(self.path, check_crc=False)), 200)
+    with open(self.path, 'ab') as f:
+      f.write(b'\x00' * 3)
+    with self.assertRaisesRegex(ValueError, 'Truncated'):
+      list(load_tfrecord(self.path, check_crc=False))
+
+  @parameterized.parameters(True, False)
+  def test_parallel(self, ordered):
+    paths = [os.path.join(self.create_tempdir().full_path, f'{i}.tfrecord')
+             for i in range(3)]
+    for i, path in enumerate(paths):
+      dump_tfrecord(path, self.data, write_index=i == 0)
+    res = list(load_tfrecord(paths, num_workers=2, chunk_size=512,
+                             ordered=ordered))
+    if ordered:
+      self.assertEqual(res, self.data * 3)
+    else:
+      self.assertCountEqual(res, self.data * 3)
+    # indices are built for files written without one.
+    self.assertTrue(all(os.path.isfile(path + '.idx') for path in paths))
+
+  def test_tfrecord_file(self):
+    dump_tfrecord(self.path, self.data, write_index=True)
+    with TFRecordFile(self.path) as f:
+      self.assertLen(f, 200)
+      self.assertEqual(f[5], self.data[5])
+      self.assertEqual(f[-1], self.data[-1])
+      self.assertEqual(f[10:12], self.data[10:12])
+      with self.assertRaises(IndexError):
+        f[200]  # pylint: disable=pointless-statement
+    # the index is rebuilt from the file.
+    os.remove(self.path + '.idx')
+    with TFRecordFile(self.path, save_index=False) as f:
+      self.assertEqual(list(f), self.data)
+
+
+if __name__ == '__main__':
+  absltest.main()
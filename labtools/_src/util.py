@@ -39,7 +39,8 @@ from pathlib import Path
 import re
 import time
 from types import ModuleType
-from typing import Any, Callable, Tuple, Type, TypeVar, Union, overload
+from typing import (Any, Callable, Dict, NamedTuple, Optional, Tuple, Type,
+                    TypeVar, Union, overload)
 import warnings
 
 from absl import flags
@@ -221,37 +222,91 @@ def compute_obj_hash(obj) -> str:
   representing it as a string.
 
   """
-  str_obj = json.dumps(obj, cls=BestEffortJSONEncoder, sort_keys=True)
+  # The stdlib backend is required for hashes to be stable across environments.
+  str_obj = json_dumps(obj,
+                       cls=BestEffortJSONEncoder,
+                       sort_keys=True,
+                       backend='json')
   return hashlib.sha256(str_obj.encode('utf-8')).hexdigest()
 
 
+def _tolist_handler(o):
+  o = tolist(o)
+  if isinstance(o, list):
+    return o
+  raise TypeError(
+      '{} is not JSON serializable. Instead use cls=BestEffortJSONEncoder'.
+      format(type(o)))
+
+
+# User-registered handlers, see `register_json_type`.
+_json_registered_types: Dict[type, Callable[[Any], Any]] = {}
+# Cache of exact type -> handler (or None if the type is not supported).
+_json_type_handlers: Dict[type, Optional[Callable[[Any], Any]]] = {}
+
+
+def register_json_type(type_: type, handler: Callable[[Any], Any]):
+  """ Registers a handler to JSON encode instances of a type.
+
+  Handlers are used by `CustomJSONEncoder` (and `BestEffortJSONEncoder`) for
+  `type_` and its subclasses, taking precedence over the builtin handlers.
+
+  Example:
+    >>> register_json_type(Fraction, lambda x: [x.numerator, x.denominator])
+    ... json_dumps({'x': Fraction(1, 3)})
+        '{"x": [1, 3]}'
+
+  Args:
+    type_: Type to handle.
+    handler: Function converting an instance of `type_` to a JSON-serializable
+      object.
+  """
+  _json_registered_types[type_] = handler
+  _json_type_handlers.clear()
+
+
+def _resolve_json_handler(type_: type) -> Optional[Callable[[Any], Any]]:
+  for base in type_.__mro__:
+    if base in _json_registered_types:
+      return _json_registered_types[base]
+  # maybe handle config dicts
+  ml_collections = maybe_import('ml_collections')
+  if ml_collections is not None:
+    if issubclass(type_, ml_collections.FieldReference):
+      return lambda o: o.get()
+    elif issubclass(type_, ml_collections.ConfigDict):
+      return lambda o: o._fields  # pylint: disable=protected-access
+  # paths
+  if issubclass(type_, Path):
+    return str
+  # lists
+  if hasattr(type_, 'tolist'):
+    return _tolist_handler
+  return None
+
+
 class CustomJSONEncoder(json.JSONEncoder):
   """JSON encoder w/ support for ConfigDicts, Paths, and Arrays.
+
+  Handlers are resolved once per exact type and cached, and additional types
+  can be supported with `register_json_type`.
+
   Note:
     This is based off of ml_collections.CustomJSONEncoder, with added support
     for Paths and Arrays (it also doesn't require ml_collections)
   """
 
   def default(self, o):
-    # maybe handle config dicts
-
-    ml_collections = maybe_import('ml_collections')
-    if ml_collections is not None:
-      if isinstance(o, ml_collections.FieldReference):
-        return o.get()
-      elif isinstance(o, ml_collections.ConfigDict):
-        return o._fields
-    # paths
-    if isinstance(o, Path):
-      return str(o)
-    # lists
-    else:
-      o = topylist(o)
-      if isinstance(o, list):
-        return o
-      raise TypeError(
-          '{} is not JSON serializable. Instead use cls=BestEffortJSONEncoder'.
-          format(type(o)))
+    type_ = type(o)
+    try:
+      handler = _json_type_handlers[type_]
+    except KeyError:
+      handler = _json_type_handlers[type_] = _resolve_json_handler(type_)
+    if handler is not None:
+      return handler(o)
+    raise TypeError(
+        '{} is not JSON serializable. Instead use cls=BestEffortJSONEncoder'.
+        format(type_))
 
 
 class BestEffortJSONEncoder(CustomJSONEncoder):
@@ -277,6 +332,201 @@ class BestEffortJSONEncoder(CustomJSONEncoder):
         return 'unserializable object of type: {}'.format(type(o))
 
 
+class JSONBackend(NamedTuple):
+  """ A JSON implementation used by `json_dumps` and `json_loads`.
+
+  Attributes:
+    dumps: Function with the signature `dumps(obj, cls, sort_keys, indent)`,
+      which should return a string or raise a `TypeError`, `ValueError` or
+      `OverflowError` for unsupported inputs (these fall back to the stdlib).
+      `cls` is a `json.JSONEncoder` whose `default` handles unsupported types.
+    loads: Function with the signature `loads(s)`, where `s` may be a string,
+      bytes, or memoryview. Inputs which raise a `ValueError` or `RuntimeError`
+      fall back to the stdlib.
+  """
+  dumps: Optional[Callable[..., str]] = None
+  loads: Optional[Callable[[Union[str, bytes, memoryview]], Any]] = None
+
+
+def _json_stdlib_dumps(obj, cls, sort_keys, indent):
+  return json.dumps(obj, cls=cls, sort_keys=sort_keys, indent=indent)
+
+
+def _json_stdlib_loads(s):
+  if isinstance(s, memoryview):
+    s = s.tobytes()
+  return json.loads(s)
+
+
+@lru_cache(maxsize=None)
+def _json_default(cls: Type[json.JSONEncoder]) -> Callable[[Any], Any]:
+  return cls().default
+
+
+def _json_orjson_dumps(obj, cls, sort_keys, indent):
+  orjson = maybe_import('orjson')
+  if indent not in (None, 2):
+    raise ValueError('orjson only supports an indent of 2.')
+  option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+  if sort_keys:
+    option |= orjson.OPT_SORT_KEYS
+  if indent:
+    option |= orjson.OPT_INDENT_2
+  return orjson.dumps(obj, default=_json_default(cls), option=option).decode()
+
+
+def _json_ujson_dumps(obj, cls, sort_keys, indent):
+  ujson = maybe_import('ujson')
+  return ujson.dumps(obj,
+                     default=_json_default(cls),
+                     sort_keys=sort_keys,
+                     indent=indent or 0,
+                     ensure_ascii=False,
+                     escape_forward_slashes=False)
+
+
+def _json_simdjson_loads(s):
+  simdjson = maybe_import('simdjson')
+  if isinstance(s, memoryview):
+    s = s.tobytes()
+  return simdjson.loads(s)
+
+
+_json_backends: Dict[str, JSONBackend] = {
+    'json': JSONBackend(_json_stdlib_dumps, _json_stdlib_loads),
+    'orjson': JSONBackend(_json_orjson_dumps, lambda s: maybe_import(
+        'orjson').loads(s)),
+    'ujson': JSONBackend(_json_ujson_dumps, lambda s: maybe_import(
+        'ujson').loads(bytes(s) if isinstance(s, memoryview) else s)),
+    'simdjson': JSONBackend(loads=_json_simdjson_loads),
+}
+# Preferred backends, in order. Only the stdlib is used to dump by default, as
+# the other backends change the output (e.g. orjson encodes NaN as `null`).
+# orjson isn't used to load by default either, as it silently parses integers
+# beyond 64 bits as floats, whereas simdjson raises (falling back to the
+# stdlib) and ujson parses them exactly.
+_json_backend_priority = {
+    'dumps': ['json'],
+    'loads': ['simdjson', 'ujson', 'json'],
+}
+_json_backend_override: Optional[str] = None
+
+
+def _json_backend_available(name: str) -> bool:
+  # The builtin third-party backends share the names of their modules.
+  return name not in ('orjson', 'simdjson', 'ujson') or is_installed(name)
+
+
+def register_json_backend(name: str,
+                          dumps: Optional[Callable[..., str]] = None,
+                          loads: Optional[Callable[..., Any]] = None,
+                          preferred: bool = False):
+  """ Registers a JSON backend.
+
+  Args:
+    name: Name of the backend.
+    dumps: See `JSONBackend.dumps`.
+    loads: See `JSONBackend.loads`.
+    preferred: Predicate indicating whether to select this backend by default.
+      Otherwise it must be selected with `set_json_backend` or `backend=`.
+  """
+  _json_backends[name] = JSONBackend(dumps, loads)
+  if preferred:
+    for priority in _json_backend_priority.values():
+      priority.insert(0, name)
+  _select_json_backend.cache_clear()
+
+
+def set_json_backend(name: Optional[str]):
+  """ Selects the JSON backend to use by default.
+
+  Note that backends may produce different output. For example, orjson and
+  ujson don't add spaces after separators, and orjson encodes NaN and Infinity
+  as `null` and loads integers beyond 64 bits as floats. Hence by default
+  `json_dumps` uses the stdlib, and `json_loads` uses the fastest installed
+  backend which parses the same values as the stdlib.
+
+  Args:
+    name: Name of a registered backend, or None to use the default backends.
+  """
+  global _json_backend_override
+  if name is not None and name not in _json_backends:
+    raise ValueError(f'Unknown JSON backend {name}, expected one of '
+                     f'{list(_json_backends)}.')
+  if name is not None and not _json_backend_available(name):
+    raise ImportError(f'JSON backend {name} is not installed.')
+  _json_backend_override = name
+  _select_json_backend.cache_clear()
+
+
+def get_json_backend(kind: str = 'dumps') -> str:
+  """ Returns the name of the backend used for `kind` ('dumps' or 'loads'). """
+  names = ([_json_backend_override]
+           if _json_backend_override else _json_backend_priority[kind])
+  for name in names:
+    if (getattr(_json_backends[name], kind) is not None and
+        _json_backend_available(name)):
+      return name
+  # e.g. simdjson, which only supports loads.
+  return 'json'
+
+
+@lru_cache(maxsize=None)
+def _select_json_backend(kind: str, name: Optional[str] = None) -> Callable:
+  """ Returns the `kind` ('dumps' or 'loads') function for a backend. """
+  if name is None:
+    name = get_json_backend(kind)
+  elif not _json_backend_available(name):
+    name = 'json'
+  # e.g. simdjson, which only supports loads.
+  return (getattr(_json_backends[name], kind) or
+          getattr(_json_backends['json'], kind))
+
+
+def json_dumps(obj: Any,
+               cls: Type[json.JSONEncoder] = BestEffortJSONEncoder,
+               sort_keys: bool = False,
+               indent: Optional[int] = None,
+               backend: Optional[str] = None) -> str:
+  """ Serializes `obj` to a JSON string using the selected backend.
+
+  Args:
+    obj: Object to serialize.
+    cls: Encoder, whose `default` method is used for unsupported types.
+    sort_keys: Predicate indicating whether to sort the keys of dicts.
+    indent: Indentation level, or None for a single line.
+    backend: Name of the backend to use. Defaults to the backend selected by
+      `set_json_backend`.
+  """
+  dumps = _select_json_backend('dumps', backend)
+  if dumps is _json_stdlib_dumps:
+    return dumps(obj, cls, sort_keys, indent)
+  try:
+    return dumps(obj, cls, sort_keys, indent)
+  except (TypeError, ValueError, OverflowError):
+    # e.g. integers over 64 bits, which the stdlib also handles.
+    return _json_stdlib_dumps(obj, cls, sort_keys, indent)
+
+
+def json_loads(s: Union[str, bytes, memoryview],
+               backend: Optional[str] = None) -> Any:
+  """ Deserializes a JSON document using the selected backend.
+
+  Args:
+    s: JSON document.
+    backend: Name of the backend to use. Defaults to the backend selected by
+      `set_json_backend`.
+  """
+  loads = _select_json_backend('loads', backend)
+  if loads is _json_stdlib_loads:
+    return loads(s)
+  try:
+    return loads(s)
+  except (ValueError, RuntimeError):
+    # e.g. NaN or integers over 64 bits, which the stdlib also handles.
+    return _json_stdlib_loads(s)
+
+
 @overload
 def ensure_listlike(x: Sequence[El]) -> Sequence[El]:
   ...
@@ -0,0 +1,156 @@
+# Copyright 2021 Cory Paik. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+""" Provides tests for `labtools._src.util` """
+
+from fractions import Fraction
+import json
+import math
+from pathlib import Path
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import ml_collections
+import numpy as np
+
+from labtools._src import util
+from labtools._src.util import BestEffortJSONEncoder
+from labtools._src.util import compute_obj_hash
+from labtools._src.util import CustomJSONEncoder
+from labtools._src.util import is_installed
+from labtools._src.util import json_dumps
+from labtools._src.util import json_loads
+from labtools._src.util import register_json_backend
+from labtools._src.util import register_json_type
+from labtools._src.util import set_json_backend
+
+_BACKENDS = ['json', 'orjson', 'ujson', 'simdjson']
+
+
+class JSONBackendTest(parameterized.TestCase):
+
+  def tearDown(self):
+    set_json_backend(None)
+    super().tearDown()
+
+  @parameterized.parameters(*_BACKENDS)
+  def test_roundtrip(self, backend):
+    if not is_installed(backend):
+      self.skipTest(f'{backend} is not installed')
+    set_json_backend(backend)
+    obj = {
+        'a': [1, 2.5, None, True],
+        'nested': {
+            'path': Path('x/y')
+        },
+        'array': np.arange(4),
+        'big': 2**70,
+        'text': 'é/',
+    }
+    expected = {
+        **obj, 'nested': {
+            'path': 'x/y'
+        },
+        'array': [0, 1, 2, 3]
+    }
+    self.assertEqual(json_loads(json_dumps(obj)), expected)
+    self.assertEqual(json_loads(json_dumps(obj).encode()), expected)
+
+  @parameterized.parameters(*_BACKENDS)
+  def test_loads_nan(self, backend):
+    if not is_installed(backend):
+      self.skipTest(f'{backend} is not installed')
+    self.assertTrue(math.isnan(json_loads('[NaN]', backend=backend)[0]))
+
+  @parameterized.parameters(*_BACKENDS)
+  def test_strict_encoder_raises(self, backend):
+    if not is_installed(backend):
+      self.skipTest(f'{backend} is not installed')
+    with self.assertRaises(TypeError):
+      json_dumps({'a': object()}, cls=CustomJSONEncoder, backend=backend)
+
+  def test_default_loads_big_int(self):
+    # e.g. orjson parses integers beyond 64 bits as floats.
+    res = json_loads(json.dumps({'id': 2**64 + 1, 'neg': -2**63 - 1}))
+    self.assertEqual(res, {'id': 2**64 + 1, 'neg': -2**63 - 1})
+    self.assertIs(type(res['id']), int)
+
+  def test_default_dumps_nan(self):
+    obj = {'loss': float('nan'), 'x': np.float32(1.5)}
+    # the default output is that of the stdlib, regardless of what's installed.
+    self.assertEqual(json_dumps(obj),
+                     json.dumps(obj, cls=BestEffortJSONEncoder))
+    self.assertTrue(math.isnan(json_loads(json_dumps(obj))['loss']))
+
+  def test_compute_obj_hash_matches_stdlib(self):
+    obj = {'b': [1, 2], 'a': {'c': 'd'}}
+    set_json_backend('orjson' if is_installed('orjson') else None)
+    self.assertEqual(json_dumps(obj, sort_keys=True, backend='json'),
+                     json.dumps(obj, sort_keys=True))
+    self.assertEqual(
+        compute_obj_hash(obj),
+        '2d8af563eff55ad8ee87f93e9f7bd9ad3a829070a96c8744c687a4b5cde3abf6')
+
+  def test_register_backend(self):
+    # restores the registry, then clears the cache of selected backends.
+    self.addCleanup(util._select_json_backend.cache_clear)
+    self.enter_context(mock.patch.dict(util._json_backends))
+    calls = []
+
+    def loads(s):
+      calls.append(s)
+      return json.loads(s)
+
+    register_json_backend('custom', loads=loads)
+    self.assertEqual(json_loads('[1]', backend='custom'), [1])
+    self.assertEqual(calls, ['[1]'])
+    with self.assertRaises(ValueError):
+      set_json_backend('missing')
+
+
+class CustomJSONEncoderTest(parameterized.TestCase):
+
+  def test_builtin_types(self):
+    cfg = ml_collections.ConfigDict({'lr': 0.1})
+    obj = {'cfg': cfg, 'path': Path('a'), 'array': np.ones((2, 1))}
+    self.assertEqual(
+        json.loads(json.dumps(obj, cls=CustomJSONEncoder)), {
+            'cfg': {
+                'lr': 0.1
+            },
+            'path': 'a',
+            'array': [[1.0], [1.0]]
+        })
+
+  def test_unsupported_type(self):
+    with self.assertRaises(TypeError):
+      json.dumps(object(), cls=CustomJSONEncoder)
+
+  def test_register_json_type(self):
+    # restores the registry, then clears the cache of resolved handlers.
+    self.addCleanup(util._json_type_handlers.clear)
+    self.enter_context(mock.patch.dict(util._json_registered_types))
+
+    class MyFraction(Fraction):
+      pass
+
+    register_json_type(Fraction, lambda x: [x.numerator, x.denominator])
+    self.assertEqual(
+        json.dumps([Fraction(1, 3), MyFraction(2, 3)], cls=CustomJSONEncoder),
+        '[[1, 3], [2, 3]]')
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -16,8 +16,10 @@
 
 from labtools._src.config import configurable
 from labtools._src.io_util import resolve_path
+from labtools._src.io_util import resolve_paths
 
 __all__ = (
     'configurable',
     'resolve_path',
+    'resolve_paths',
 )